@@ -0,0 +1,111 @@
+"""
+This module parses the packed text columns of the question banks once, when they are compiled.
+Answer Options hold one comma separated string per question, but thousands of questions share the same
+few scales, so every distinct string is parsed once and interned as an option set: the question bank
+keeps Answer Options as a categorical whose codes are the option-set ids, and the catalog stores each
+parsed set once. The personal questions pack several questions into one cell separated by ";", and are
+exploded into one row per question.
+"""
+
+import functools
+import re
+
+import numpy as np
+import pandas as pd
+
+OPTION_SEPARATOR = ","
+QUESTION_SEPARATOR = ";"
+
+# A whole numeric scale such as "1-10"
+NUMERIC_RANGE = re.compile(r"^(\d+)\s*-\s*(\d+)$")
+
+
+@functools.lru_cache(maxsize=4096)
+def parse_options(text):
+    """
+    Split an Answer Options string into its options. Results are cached, so each scale is only parsed
+    once per process however many exports use it.
+
+    Args:
+        text (str): The options, separated by commas. A numeric range such as "1-10" stands for every
+            number in it.
+
+    Returns:
+        tuple: The options, empty for a missing value.
+    """
+    if not isinstance(text, str):
+        return ()
+    options = tuple(option.strip() for option in text.split(OPTION_SEPARATOR) if option.strip())
+    if len(options) == 1:
+        match = NUMERIC_RANGE.match(options[0])
+        if match and int(match.group(1)) <= int(match.group(2)):
+            return tuple(str(number) for number in range(int(match.group(1)), int(match.group(2)) + 1))
+    return options
+
+
+def option_sets(values):
+    """
+    Intern the Answer Options of some rows as option sets.
+
+    Args:
+        values (pd.Series): The Answer Options, as a categorical or as strings.
+
+    Returns:
+        tuple: The option-set id of every row (-1 for a missing value) and the parsed sets, by id.
+    """
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        codes, texts = values.cat.codes.to_numpy(), values.cat.categories
+    else:
+        codes, texts = pd.factorize(values)
+    return np.asarray(codes, dtype=np.int64), [parse_options(text) for text in texts]
+
+
+def option_table(values):
+    """
+    Build the table of option sets stored in the catalog, one row per option.
+
+    Args:
+        values (pd.Series): The Answer Options of the question bank, as a categorical.
+
+    Returns:
+        pd.DataFrame: The set id, the position in the set and the text of every option.
+    """
+    _, sets = option_sets(values)
+    return pd.DataFrame({
+        "set": np.repeat(np.arange(len(sets), dtype=np.int64), [len(options) for options in sets]),
+        "position": np.concatenate([np.arange(len(options), dtype=np.int64) for options in sets] + [np.empty(0, dtype=np.int64)]),
+        "option": pd.Series([option for options in sets for option in options], dtype=object),
+    })
+
+
+def nested_options(values):
+    """
+    Get the options of every row as a list, for nested exports.
+
+    Args:
+        values (pd.Series): The Answer Options, as a categorical or as strings (e.g. after an edit).
+
+    Returns:
+        pd.Series: One list of options per row, None for a missing value, indexed like values.
+    """
+    codes, sets = option_sets(values)
+    lists = np.empty(len(sets) + 1, dtype=object)
+    lists[:-1] = [list(options) for options in sets]
+    # Code -1 picks the trailing None
+    return pd.Series(lists[codes], index=values.index, name=values.name)
+
+
+def explode_personal(df):
+    """
+    Split the packed personal questions into one row per question.
+
+    Args:
+        df (pd.DataFrame): The personal questions as read, with several questions per cell.
+
+    Returns:
+        pd.DataFrame: One row per question, in file order, with the type and subtype of its cell.
+    """
+    questions = df["Question"].str.split(QUESTION_SEPARATOR).explode().str.strip()
+    exploded = df.drop(columns="Question").loc[questions.index].assign(Question=questions.to_numpy())
+    exploded = exploded[exploded["Question"].fillna("") != ""]
+    return exploded.reset_index(drop=True)
@@ -0,0 +1,488 @@
+"""
+This module serves the question engine over a local HTTP API built on asyncio, for clients such as
+the intake portal that need questionnaires from code. Endpoints (all GET, repeat a parameter to
+select several values):
+
+    /questions?domain=..&stakeholder=..&metric=..&type=..&timeline=12&format=json
+        Generated questions, like the app. "type" defaults to every type reachable from the metrics.
+        Optional: q (full-text search), budget, metric_quota, type_quota, duplicates=keep|flag|collapse.
+    /facets/domains, /facets/stakeholders, /facets/metrics, /facets/types
+        The values reachable from the given domain, stakeholder, metric and type parameters.
+    /descriptions, /descriptions/<name>
+        The description dictionaries of lookup_dicts.py, e.g. /descriptions/metrics_descriptions.
+    /options
+        The answer option sets, each with the options it offers and the scale text used in the questions.
+    /personal?format=csv
+        The personal questions, one row per question.
+    /metrics
+        Request timings and counters in the Prometheus text format.
+    /health
+        The version of the loaded question bank and the result cache statistics.
+
+Every response carries an ETag derived from the catalog version and the request, so a conditional
+request is answered with 304 before anything is computed. Identical requests that arrive while one
+is being computed wait for that computation instead of repeating it, results are kept in a shared
+SelectionCache, and exports are streamed with chunked transfer encoding. Usage:
+
+    python api_server.py --port 8502
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import sys
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import question_engine
+from dedup import mark_duplicates
+from export import DEFAULT_CHUNKSIZE, FORMATS, iter_export
+from instrumentation import MetricsRegistry
+from live_bank import LiveBank
+from result_cache import SelectionCache
+
+STATUS_TEXT = {200: "OK", 304: "Not Modified", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 500: "Internal Server Error"}
+
+# Query parameter -> facet column
+FACET_PARAMETERS = {
+    "domain": "Domain",
+    "stakeholder": "Stakeholder",
+    "metric": "Metric Area",
+    "type": "Question Type",
+}
+
+# /facets/<name> -> facet column
+FACET_ENDPOINTS = {
+    "domains": "Domain",
+    "stakeholders": "Stakeholder",
+    "metrics": "Metric Area",
+    "types": "Question Type",
+}
+
+# First path segments of the endpoints, the only values of the endpoint metrics label besides "unknown"
+ENDPOINTS = ("questions", "facets", "descriptions", "options", "personal", "metrics", "health")
+
+# Upper bound on the size of a request head, which is all a GET request has
+MAX_HEAD_BYTES = 65536
+
+
+class HTTPError(Exception):
+    """
+    An error answered with an HTTP status and a JSON message.
+    """
+
+    def __init__(self, status, message):
+        """
+        Args:
+            status (int): The HTTP status.
+            message (str): The error message.
+        """
+        super().__init__(message)
+        self.status = status
+
+
+def int_parameter(params, name, default, low=0, high=None):
+    """
+    Read an integer query parameter.
+
+    Args:
+        params (dict): The parsed query parameters.
+        name (str): The parameter name.
+        default (int): The value when the parameter is missing.
+        low (int): The smallest allowed value.
+        high (int): The largest allowed value, or None.
+
+    Returns:
+        int: The value.
+
+    Raises:
+        HTTPError: If the value is not an integer in range.
+    """
+    if name not in params:
+        return default
+    try:
+        value = int(params[name][-1])
+    except ValueError:
+        raise HTTPError(400, f"{name} must be an integer") from None
+    if value < low or (high is not None and value > high):
+        raise HTTPError(400, f"{name} must be between {low} and {high}" if high is not None else f"{name} must be at least {low}")
+    return value
+
+
+class QuestionAPI:
+    """
+    The request handlers, with the response cache and the computations in flight.
+    """
+
+    def __init__(self, live_bank, cache=None, registry=None, chunksize=DEFAULT_CHUNKSIZE):
+        """
+        Args:
+            live_bank (LiveBank): The question bank to serve.
+            cache (SelectionCache): The result cache, a new one by default.
+            registry (MetricsRegistry): The metrics registry, a new one by default.
+            chunksize (int): The number of rows per streamed chunk.
+        """
+        self.live_bank = live_bank
+        self.cache = cache or SelectionCache()
+        self.registry = registry or MetricsRegistry()
+        self.chunksize = chunksize
+        self._inflight = {}
+
+    async def compute(self, key, function):
+        """
+        Get a result from the cache, or compute it once however many requests ask for it at the same time.
+
+        Args:
+            key (tuple): The cache key.
+            function (callable): Computes the result in a worker thread.
+
+        Returns:
+            The result.
+        """
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().run_in_executor(None, self.cache.get_or_compute, key, function)
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.registry.inc("api_coalesced_requests")
+        # A client that disconnects must not cancel the computation for the others
+        return await asyncio.shield(future)
+
+    async def handle_connection(self, reader, writer):
+        """
+        Serve the requests of one connection, keeping it open between requests unless asked not to.
+
+        Args:
+            reader (asyncio.StreamReader): The connection input.
+            writer (asyncio.StreamWriter): The connection output.
+        """
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    break
+                lines = head.decode("latin-1").split("\r\n")
+                try:
+                    method, target, version = lines[0].split(" ", 2)
+                except ValueError:
+                    await self.send(writer, 400, {}, json_body({"error": "Malformed request line"}), keep_alive=False)
+                    break
+                headers = {}
+                for line in lines[1:]:
+                    name, _, value = line.partition(":")
+                    if name:
+                        headers[name.strip().lower()] = value.strip()
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+
+                # Arbitrary paths must not create new metrics series
+                endpoint = urlsplit(target).path.strip("/").split("/")[0]
+                with self.registry.span("api_request", endpoint=endpoint if endpoint in ENDPOINTS else "unknown"):
+                    try:
+                        status, response_headers, body = await self.dispatch(method, target, headers)
+                    except HTTPError as e:
+                        status, response_headers, body = e.status, {}, json_body({"error": str(e)})
+                    except Exception as e:
+                        status, response_headers, body = 500, {}, json_body({"error": f"{type(e).__name__}: {e}"})
+                    self.registry.inc("api_responses", status=status)
+                    await self.send(writer, status, response_headers, body, head=method == "HEAD", keep_alive=keep_alive)
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, method, target, headers):
+        """
+        Route a request to its handler and answer conditional requests.
+
+        Args:
+            method (str): The HTTP method.
+            target (str): The request target, with its query string.
+            headers (dict): The request headers, with lowercase names.
+
+        Returns:
+            tuple: The status, the response headers and the body, as bytes or an iterator of bytes.
+        """
+        if method not in ("GET", "HEAD"):
+            raise HTTPError(405, f"Method {method} not allowed")
+        url = urlsplit(target)
+        parts = [unquote(part) for part in url.path.strip("/").split("/")]
+        params = parse_qs(url.query)
+        if parts == ["metrics"]:
+            return 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}, self.registry.render().encode("utf-8")
+
+        # One state per request, so a reload in the middle of it cannot mix two versions
+        state = self.live_bank.current()
+        if parts == ["health"]:
+            health = {"version": state.version, "reloads": self.live_bank.reloads, "cache": self.cache.stats()}
+            return 200, {"Cache-Control": "no-store"}, json_body(health)
+        routes = {
+            "questions": self.questions,
+            "facets": self.facets,
+            "descriptions": self.descriptions,
+            "options": self.options,
+            "personal": self.personal,
+        }
+        if parts[0] not in routes:
+            raise HTTPError(404, f"Unknown endpoint /{'/'.join(parts)}")
+
+        request_key = (state.version, tuple(parts), tuple(sorted((name, tuple(values)) for name, values in params.items())))
+        etag = '"' + hashlib.sha1(repr(request_key).encode("utf-8")).hexdigest() + '"'
+        response_headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if etag in [tag.strip() for tag in headers.get("if-none-match", "").split(",")] or headers.get("if-none-match") == "*":
+            self.registry.inc("api_not_modified")
+            return 304, response_headers, b""
+        content_type, body = await routes[parts[0]](state, parts[1:], params, head=method == "HEAD")
+        response_headers["Content-Type"] = content_type
+        return 200, response_headers, body
+
+    def selection(self, state, params):
+        """
+        Read the facet selection of a request, defaulting the question types like the app does.
+
+        Args:
+            state (BankState): The question bank.
+            params (dict): The parsed query parameters.
+
+        Returns:
+            dict: The domains, stakeholders, metrics and question types.
+        """
+        metrics = params.get("metric", [])
+        questiontype = params.get("type")
+        if questiontype is None:
+            index = state.facet_index
+            questiontype = index.values("Question Type", where=index.match("Metric Area", metrics) if metrics else None)
+        return {
+            "domains": params.get("domain", []),
+            "stakeholders": params.get("stakeholder", []),
+            "metrics": metrics,
+            "questiontype": questiontype,
+        }
+
+    def export_format(self, params):
+        """
+        Read the requested export format.
+
+        Args:
+            params (dict): The parsed query parameters.
+
+        Returns:
+            str: The format, one of export.FORMATS.
+
+        Raises:
+            HTTPError: If the format is unknown.
+        """
+        fmt = params.get("format", ["json"])[-1]
+        if fmt not in FORMATS:
+            raise HTTPError(400, f"format must be one of {', '.join(FORMATS)}")
+        return fmt
+
+    async def export(self, fmt, key, function, head):
+        """
+        Stream a computed DataFrame in the requested format. A HEAD request gets the same headers
+        without the DataFrame being computed.
+
+        Args:
+            fmt (str): The export format.
+            key (tuple): The cache key of the DataFrame.
+            function (callable): Computes the DataFrame in a worker thread.
+            head (bool): Whether the request is a HEAD request.
+
+        Returns:
+            tuple: The content type and an iterator over the encoded chunks.
+        """
+        if head:
+            return FORMATS[fmt][1], iter(())
+        return FORMATS[fmt][1], iter_export(await self.compute(key, function), fmt, self.chunksize)
+
+    async def questions(self, state, parts, params, head=False):
+        """
+        Handle /questions.
+        """
+        if parts:
+            raise HTTPError(404, "Unknown endpoint")
+        fmt = self.export_format(params)
+        selection = self.selection(state, params)
+        timeline = int_parameter(params, "timeline", 3, 3, 60)
+        query = " ".join(params.get("q", [""])[-1].split())
+        budget = int_parameter(params, "budget", 0)
+        duplicates = params.get("duplicates", ["keep"])[-1]
+        if duplicates not in ("keep", "flag", "collapse"):
+            raise HTTPError(400, "duplicates must be keep, flag or collapse")
+        quotas = {}
+        for name, column in (("metric_quota", "Metric Area"), ("type_quota", "Question Type")):
+            limit = int_parameter(params, name, 0)
+            if limit:
+                values = selection["metrics"] if column == "Metric Area" else selection["questiontype"]
+                quotas[column] = {value: limit for value in values}
+
+        def generate():
+            if query:
+                df = question_engine.search_questions(
+                    state.bank, query, timeline, search_index=state.search_index, index=state.facet_index, **selection,
+                )
+            elif budget:
+                df = question_engine.build_questionnaire(
+                    state.bank, timeline, budget=budget, quotas=quotas, index=state.facet_index,
+                    duplicate_index=state.duplicate_index if duplicates == "collapse" else None, **selection,
+                )
+            else:
+                df = question_engine.generate_questions(state.bank, timeline, index=state.facet_index, **selection)
+            if duplicates != "keep":
+                df = mark_duplicates(df, state.duplicate_index, mode=duplicates)
+            return df
+
+        key = ("api", "questions", state.version, timeline, query.lower(), budget, repr(sorted(quotas.items())), duplicates) + tuple(
+            tuple(sorted(set(values))) for values in selection.values()
+        )
+        return await self.export(fmt, key, generate, head)
+
+    async def facets(self, state, parts, params, head=False):
+        """
+        Handle /facets/<name>.
+        """
+        if len(parts) != 1 or parts[0] not in FACET_ENDPOINTS:
+            raise HTTPError(404, f"Unknown facet, expected one of {', '.join(FACET_ENDPOINTS)}")
+        index = state.facet_index
+        selected = [params.get(name, []) for name in FACET_PARAMETERS]
+        where = index.select_bits(*selected, skip_empty=True) if any(selected) else None
+        return "application/json", json_body(index.values(FACET_ENDPOINTS[parts[0]], where=where))
+
+    async def descriptions(self, state, parts, params, head=False):
+        """
+        Handle /descriptions and /descriptions/<name>.
+        """
+        descriptions = state.descriptions
+        if not parts:
+            return "application/json", json_body(descriptions)
+        if len(parts) != 1 or parts[0] not in descriptions:
+            raise HTTPError(404, f"Unknown descriptions, expected one of {', '.join(descriptions)}")
+        return "application/json", json_body(descriptions[parts[0]])
+
+    async def options(self, state, parts, params, head=False):
+        """
+        Handle /options.
+        """
+        if parts:
+            raise HTTPError(404, "Unknown endpoint")
+        texts = state.bank.categories(question_engine.OPTIONS_COLUMN)
+        sets = [{"id": i, "scale": text, "options": options} for i, (text, options) in enumerate(zip(texts, state.option_sets))]
+        return "application/json", json_body(sets)
+
+    async def personal(self, state, parts, params, head=False):
+        """
+        Handle /personal.
+        """
+        if parts:
+            raise HTTPError(404, "Unknown endpoint")
+        fmt = self.export_format(params)
+        key = ("api", "personal", state.version)
+        return await self.export(fmt, key, lambda: question_engine.generate_personal_questions(catalog=state.catalog), head)
+
+    async def send(self, writer, status, headers, body, head=False, keep_alive=True):
+        """
+        Write a response, streaming iterator bodies with chunked transfer encoding.
+
+        Args:
+            writer (asyncio.StreamWriter): The connection output.
+            status (int): The HTTP status.
+            headers (dict): The response headers.
+            body (bytes or iterator): The body.
+            head (bool): Whether to send the headers only, as a HEAD response has no body.
+            keep_alive (bool): Whether the connection stays open.
+        """
+        headers = dict(headers)
+        headers.setdefault("Content-Type", "application/json")
+        headers["Connection"] = "keep-alive" if keep_alive else "close"
+        streamed = not isinstance(body, bytes)
+        if streamed:
+            headers["Transfer-Encoding"] = "chunked"
+        else:
+            headers["Content-Length"] = str(len(body))
+        head_lines = [f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}"] + [f"{name}: {value}" for name, value in headers.items()]
+        writer.write(("\r\n".join(head_lines) + "\r\n\r\n").encode("latin-1"))
+        if head or status == 304:
+            await writer.drain()
+            return
+        if not streamed:
+            writer.write(body)
+            await writer.drain()
+            return
+        loop = asyncio.get_running_loop()
+        size = 0
+        while True:
+            # Chunks are encoded in a worker thread, so a large export does not block other requests
+            chunk = await loop.run_in_executor(None, next, body, None)
+            if chunk is None:
+                break
+            if chunk:
+                size += len(chunk)
+                writer.write(f"{len(chunk):X}\r\n".encode("ascii") + chunk + b"\r\n")
+                await writer.drain()
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+        self.registry.inc("api_streamed_bytes", size)
+
+
+def json_body(value):
+    """
+    Encode a JSON response body.
+
+    Args:
+        value: The value to encode.
+
+    Returns:
+        bytes: The UTF-8 JSON.
+    """
+    return json.dumps(value, ensure_ascii=False).encode("utf-8")
+
+
+async def serve(api, host="127.0.0.1", port=8502):
+    """
+    Start serving the API.
+
+    Args:
+        api (QuestionAPI): The request handlers.
+        host (str): The address to bind, local only by default.
+        port (int): The port to listen on.
+
+    Returns:
+        asyncio.Server: The running server.
+    """
+    return await asyncio.start_server(api.handle_connection, host, port, limit=MAX_HEAD_BYTES)
+
+
+def main(argv=None):
+    """
+    The main function to run the API server.
+    """
+    parser = argparse.ArgumentParser(description="Serve the question generator over a local HTTP API.")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to bind (default: 127.0.0.1).")
+    parser.add_argument("--port", type=int, default=8502, help="Port to listen on (default: 8502).")
+    parser.add_argument("--main-db", default=question_engine.MAIN_DB_PATH, help="Path to the main question bank.")
+    parser.add_argument("--personal-db", default=question_engine.PERSONAL_DB_PATH, help="Path to the personal questions.")
+    parser.add_argument("--reload-interval", type=float, default=5.0, help="Seconds between checks of the question banks for changes.")
+    args = parser.parse_args(argv)
+
+    live_bank = LiveBank(args.main_db, args.personal_db, interval=args.reload_interval)
+    live_bank.start()
+    api = QuestionAPI(live_bank)
+
+    async def run():
+        server = await serve(api, args.host, args.port)
+        print(f"Serving on http://{args.host}:{args.port}", file=sys.stderr)
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
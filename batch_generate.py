@@ -0,0 +1,164 @@
+"""
+This module generates many questionnaires in one process from a JSONL file of selection specs.
+Each line is a JSON object such as:
+
+    {"name": "acme", "domains": ["Funding Organisation"], "stakeholders": ["Grant Recipients"],
+     "metrics": ["Funding Impact"], "question_types": ["Yes or no"], "timeline": 12, "personal": true}
+
+"question_types" defaults to every type reachable from the selected metrics, like the app does,
+and "timeline" defaults to 3 months. "name" is the output folder of the spec, which no two specs
+may share. Usage:
+
+    python batch_generate.py specs.jsonl --out questionnaires/ --format csv json parquet
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+
+import question_engine
+from export import FORMATS, write_export
+from facet_index import FACET_COLUMNS, FacetIndex
+
+
+def read_specs(path):
+    """
+    Read the selection specs from a JSONL file, skipping blank lines.
+
+    Args:
+        path (str): Path to the JSONL file.
+
+    Returns:
+        list: The parsed specs, one dict per line.
+    """
+    specs = []
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                specs.append(json.loads(line))
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{path}:{line_number}: invalid JSON: {e}") from e
+    return specs
+
+
+def safe_name(text, default):
+    """
+    Turn text into a filesystem-safe file or folder name.
+
+    Args:
+        text (str): The text to turn into a name.
+        default (str): The name to use when nothing of the text is left.
+
+    Returns:
+        str: The name.
+    """
+    return re.sub(r"[^\w.-]+", "_", str(text)).strip("._") or default
+
+
+def spec_name(spec, position):
+    """
+    Get a filesystem-safe output folder name for a spec.
+
+    Args:
+        spec (dict): The selection spec.
+        position (int): Position of the spec in the file, used when it has no name.
+
+    Returns:
+        str: The folder name.
+    """
+    return safe_name(spec.get("name") or f"spec-{position}", f"spec-{position}")
+
+
+def spec_folders(specs):
+    """
+    Get the output folder name of every spec, checking that no two specs share one.
+
+    Args:
+        specs (list): The selection specs, in file order.
+
+    Returns:
+        list: The folder names, in the order of specs.
+
+    Raises:
+        ValueError: If two specs get the same folder name, ignoring case for case-insensitive filesystems.
+    """
+    names = [spec_name(spec, position) for position, spec in enumerate(specs, start=1)]
+    positions = {}
+    for position, name in enumerate(names, start=1):
+        positions.setdefault(name.casefold(), []).append(position)
+    clashes = [f"specs {', '.join(map(str, found))} ({names[found[0] - 1]})" for found in positions.values() if len(found) > 1]
+    if clashes:
+        raise ValueError(f"specs would overwrite each other's output folder: {'; '.join(clashes)}")
+    return names
+
+
+def generate_for_spec(db, index, spec):
+    """
+    Generate the questionnaire for one selection spec.
+
+    Args:
+        db (CatalogTable): The question bank.
+        index (FacetIndex): The facet index over db.
+        spec (dict): The selection spec.
+
+    Returns:
+        pd.DataFrame: The generated questions.
+    """
+    metrics = spec.get("metrics", [])
+    questiontype = spec.get("question_types")
+    if questiontype is None:
+        where = index.match("Metric Area", metrics) if metrics else None
+        questiontype = index.values("Question Type", where=where)
+    return question_engine.generate_questions(
+        db,
+        timeline=int(spec.get("timeline", 3)),
+        stakeholders=spec.get("stakeholders", []),
+        metrics=metrics,
+        domains=spec.get("domains", []),
+        questiontype=questiontype,
+        index=index,
+    )
+
+
+def main(argv=None):
+    """
+    The main function to run the batch generation.
+    """
+    parser = argparse.ArgumentParser(description="Generate questionnaires for many selection specs.")
+    parser.add_argument("specs", help="JSONL file with one selection spec per line.")
+    parser.add_argument("--out", default="questionnaires", help="Output folder (default: questionnaires).")
+    parser.add_argument("--format", nargs="+", choices=list(FORMATS), default=["csv"], help="Output formats.")
+    parser.add_argument("--main-db", default=question_engine.MAIN_DB_PATH, help="Path to the main question bank.")
+    parser.add_argument("--personal-db", default=question_engine.PERSONAL_DB_PATH, help="Path to the personal questions.")
+    args = parser.parse_args(argv)
+
+    specs = read_specs(args.specs)
+    # Checked before any output is written, so a clash never leaves half the specs generated
+    folders = spec_folders(specs)
+    catalog = question_engine.load_catalog(args.main_db, args.personal_db)
+    db = catalog.tables["bank"]
+    index = FacetIndex.from_frame(db.frame(columns=FACET_COLUMNS))
+    personal_questions_df = None
+
+    for spec, name in zip(specs, folders):
+        folder = os.path.join(args.out, name)
+        os.makedirs(folder, exist_ok=True)
+        data_df = generate_for_spec(db, index, spec)
+        if spec.get("personal") and personal_questions_df is None:
+            personal_questions_df = question_engine.generate_personal_questions(catalog=catalog)
+        for fmt in args.format:
+            extension = FORMATS[fmt][0]
+            write_export(data_df, fmt, os.path.join(folder, f"finalQuestions.{extension}"))
+            if spec.get("personal"):
+                write_export(personal_questions_df, fmt, os.path.join(folder, f"personalQuestions.{extension}"))
+        print(f"{folder}: {len(data_df)} questions", file=sys.stderr)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,351 @@
+"""
+This module benchmarks the question engine on synthetic question banks with the same schema as mainDB.csv.
+It times each stage (cold and warm load, facet index build, filtering, the facet cascade, budgeted
+questionnaires, full-text search, near-duplicate detection, incremental reload and every export format),
+reports throughput and peak traced memory as JSON, and compares the run with a saved baseline.
+Before timing anything it checks that an edited description in lookup_dicts.py reaches a reloaded bank.
+Usage:
+
+    python benchmark.py --sizes 1e3 1e4 1e5 --output bench.json
+    python benchmark.py --sizes 1e3 1e4 1e5 --baseline bench.json --tolerance 0.25
+
+Peak memory is measured with tracemalloc in a second run of each stage, so it covers Python and numpy
+allocations but not memory allocated directly by the CSV parser.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import question_engine
+from dedup import DuplicateIndex
+from export import FORMATS, iter_export
+from facet_index import FacetIndex
+from live_bank import LiveBank
+from search_index import SearchIndex
+
+WORDS = (
+    "how what would you rate describe funding impact community program participants skills experience "
+    "organisation support change learning outcomes performance coach volunteer training resources "
+    "engagement development growth knowledge attitude behavior decision efficiency career grant process "
+    "management application satisfaction quality access services staff members sessions goals progress"
+).split()
+
+OPTION_SETS = (
+    "",
+    " Yes, No",
+    " 1-10",
+    " No impact, Minor impact, Moderate impact, Major impact, Transformative impact ",
+    " Very poor, Poor, Average, Good, Excellent",
+    " Not at all useful, Slightly useful, Moderately useful, Very useful, Extremely useful",
+)
+
+
+def make_synthetic_bank(rows, domains=10, stakeholders=9, metrics=24, types=6, seed=0):
+    """
+    Builds a synthetic question bank with the schema and padding of mainDB.csv.
+
+    Metric areas are correlated with stakeholders, like in the real bank, so the facet cascade
+    narrows the reachable metrics. Question texts are drawn from a pool, so the bank has repeats.
+
+    Args:
+        rows (int): The number of questions.
+        domains (int): The number of distinct domains.
+        stakeholders (int): The number of distinct stakeholders.
+        metrics (int): The number of distinct metric areas.
+        types (int): The number of distinct question types.
+        seed (int): The random seed.
+
+    Returns:
+        pd.DataFrame: The synthetic bank, with unstripped values as they appear in the CSV.
+    """
+    rng = np.random.default_rng(seed)
+    stakeholder_codes = rng.integers(0, stakeholders, rows)
+    metric_codes = (stakeholder_codes * max(metrics // stakeholders, 1) + rng.integers(0, 4, rows)) % metrics
+    type_codes = rng.integers(0, types, rows)
+    pool_size = max(min(rows, 50000), 1)
+    pool = np.array([
+        " " + " ".join(rng.choice(WORDS, rng.integers(6, 14))).capitalize() + "? "
+        for _ in range(pool_size)
+    ], dtype=object)
+
+    def labels(prefix, count):
+        return np.array([f" {prefix} {i} " for i in range(count)], dtype=object)
+
+    return pd.DataFrame({
+        "Domain": labels("Domain", domains)[rng.integers(0, domains, rows)],
+        "Stakeholder": labels("Stakeholder", stakeholders)[stakeholder_codes],
+        "Metric Area": labels("Metric", metrics)[metric_codes],
+        "Question Type": labels("Type", types)[type_codes],
+        "Question": pool[rng.integers(0, pool_size, rows)],
+        "Answer Options": np.array(OPTION_SETS, dtype=object)[type_codes % len(OPTION_SETS)],
+    })
+
+
+def random_selection(index, rng):
+    """
+    Picks a random selection the way a user would: some domains, some stakeholders, then metrics
+    and question types reachable from them.
+
+    Args:
+        index (FacetIndex): The facet index of the bank.
+        rng (random.Random): The random generator.
+
+    Returns:
+        dict: Keyword arguments for generate_questions, without data and timeline.
+    """
+    def pick(values, most):
+        return rng.sample(values, min(len(values), rng.randint(1, most)))
+
+    domains = pick(index.values("Domain"), 3)
+    stakeholders = pick(index.values("Stakeholder"), 3)
+    metrics = pick(index.values("Metric Area", where=index.match("Stakeholder", stakeholders)), 4)
+    questiontype = index.values("Question Type", where=index.match("Metric Area", metrics))
+    return {"domains": domains, "stakeholders": stakeholders, "metrics": metrics, "questiontype": questiontype}
+
+
+def measure(function, repeat, memory):
+    """
+    Times a function and optionally measures its peak traced memory in a separate run.
+
+    Args:
+        function (callable): The stage to measure, returning the number of items it processed.
+        repeat (int): The number of timed runs, of which the fastest is kept.
+        memory (bool): Whether to measure peak memory.
+
+    Returns:
+        dict: Seconds, items processed and peak bytes (None when not measured).
+    """
+    seconds = float("inf")
+    for _ in range(max(repeat, 1)):
+        start = time.perf_counter()
+        items = function()
+        seconds = min(seconds, time.perf_counter() - start)
+    peak = None
+    if memory:
+        tracemalloc.start()
+        try:
+            function()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return {"seconds": seconds, "items": items, "peak_bytes": peak}
+
+
+def bench_size(rows, folder, args):
+    """
+    Runs every stage on one synthetic bank.
+
+    Args:
+        rows (int): The number of questions in the bank.
+        folder (str): Temporary folder for the bank files.
+        args (argparse.Namespace): The benchmark options.
+
+    Returns:
+        list: One result dict per stage.
+    """
+    path = os.path.join(folder, f"bank-{rows}.csv")
+    make_synthetic_bank(rows, args.domains, args.stakeholders, args.metrics, args.types, args.seed).to_csv(path, index=False)
+
+    def cold_load():
+        if os.path.exists(question_engine.catalog_path(path)):
+            os.remove(question_engine.catalog_path(path))
+        return len(question_engine.load_data(path))
+
+    stages = {"cold_load": cold_load}
+    stages["warm_load"] = lambda: len(question_engine.load_data(path))
+    db = question_engine.load_data(path)
+    stages["facet_index"] = lambda: len(FacetIndex.from_frame(db).bitsets)
+    index = FacetIndex.from_frame(db)
+
+    rng = random.Random(args.seed)
+    selections = [random_selection(index, rng) for _ in range(args.queries)]
+
+    def filtering():
+        return sum(len(question_engine.generate_questions(db, 3, index=index, **selection)) for selection in selections)
+
+    def cascade():
+        for selection in selections:
+            index.values("Metric Area", where=index.match("Stakeholder", selection["stakeholders"]))
+            index.values("Question Type", where=index.match("Metric Area", selection["metrics"]))
+        return len(selections)
+
+    stages["filtering"] = filtering
+    stages["facet_cascade"] = cascade
+
+    def questionnaire():
+        return sum(len(question_engine.build_questionnaire(db, 3, budget=50, index=index, **selection)) for selection in selections)
+
+    stages["questionnaire"] = questionnaire
+    stages["search_index"] = lambda: len(SearchIndex.from_frame(db).postings)
+    search_index = SearchIndex.from_frame(db)
+    queries = [" ".join(rng.sample(WORDS, rng.randint(1, 3))) for _ in range(args.queries)]
+
+    def search():
+        for query in queries:
+            search_index.search(query, limit=50)
+        return len(queries)
+
+    stages["search"] = search
+    stages["dedup_index"] = lambda: len(DuplicateIndex.from_frame(db).signatures)
+
+    # Reload alternately an edited copy of the bank, with 1% of its questions changed, and the original
+    versions = [os.path.join(folder, f"bank-{rows}-{name}.csv") for name in ("edited", "original")]
+    edited = pd.read_csv(path, dtype=str)
+    edited.to_csv(versions[1], index=False)
+    changed = rng.sample(range(rows), max(rows // 100, 1))
+    edited.loc[changed, "Question"] = edited.loc[changed, "Question"] + " (edited)"
+    edited.to_csv(versions[0], index=False)
+    live_bank = LiveBank(path)
+    live_bank.state.build_indexes()
+
+    def reload():
+        shutil.copyfile(versions[live_bank.reloads % 2], path)
+        live_bank.refresh()
+        return rows
+
+    stages["reload"] = reload
+
+    # Export the broadest of the selections, the case that hurts most in the app
+    result = max((question_engine.generate_questions(db, 3, index=index, **selection) for selection in selections), key=len)
+
+    def export(fmt):
+        for _ in iter_export(result, fmt):
+            pass
+        return len(result)
+
+    for fmt in FORMATS:
+        stages[f"export_{fmt}"] = lambda fmt=fmt: export(fmt)
+
+    results = []
+    for stage, function in stages.items():
+        if args.stages and stage not in args.stages:
+            continue
+        measured = measure(function, args.repeat, args.memory)
+        throughput = measured["items"] / measured["seconds"] if measured["seconds"] else None
+        results.append({"rows": rows, "stage": stage, **measured, "items_per_second": throughput})
+        print(f"{rows:>10} {stage:<18} {measured['seconds'] * 1000:10.2f} ms", file=sys.stderr)
+    return results
+
+
+def check_description_reload(folder):
+    """
+    Check that an edit to lookup_dicts.py reaches the descriptions of a reloaded bank, using a copy
+    of it next to a small synthetic bank.
+
+    Args:
+        folder (str): Temporary folder for the bank files.
+
+    Raises:
+        RuntimeError: If the reloaded bank still has the old description.
+    """
+    path = os.path.join(folder, "bank-descriptions.csv")
+    make_synthetic_bank(100).to_csv(path, index=False)
+    lookup_path = os.path.join(folder, "lookup_dicts.py")
+    shutil.copyfile(question_engine.LOOKUP_DICTS_PATH, lookup_path)
+    live_bank = LiveBank(path, os.path.join(folder, "personal-none.csv"), lookup_path=lookup_path)
+    kind, descriptions = next(iter(live_bank.state.descriptions.items()))
+    name, text = next(iter(descriptions.items()))
+    edited = f"{text} (edited)"
+    with open(lookup_path, encoding="utf-8") as f:
+        source = f.read()
+    # Appending a longer assignment changes the size as well as the modification time
+    with open(lookup_path, "w", encoding="utf-8") as f:
+        f.write(f"{source}\n{kind}[{name!r}] = {edited!r}\n")
+    if not live_bank.refresh() or live_bank.state.descriptions[kind][name] != edited:
+        raise RuntimeError(f"Reload kept the old description of {name!r} in {kind}")
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compares stage timings with a saved baseline.
+
+    Args:
+        results (list): The results of this run.
+        baseline (dict): A report saved by an earlier run.
+        tolerance (float): Allowed relative slowdown before a stage counts as a regression.
+
+    Returns:
+        list: One dict per stage found in both runs, with the time ratio and a regression flag.
+    """
+    previous = {(r["rows"], r["stage"]): r for r in baseline["results"]}
+    comparisons = []
+    for result in results:
+        before = previous.get((result["rows"], result["stage"]))
+        if before is None or not before["seconds"]:
+            continue
+        ratio = result["seconds"] / before["seconds"]
+        comparisons.append({
+            "rows": result["rows"],
+            "stage": result["stage"],
+            "baseline_seconds": before["seconds"],
+            "seconds": result["seconds"],
+            "ratio": ratio,
+            "regression": ratio > 1 + tolerance,
+        })
+    return comparisons
+
+
+def main(argv=None):
+    """
+    The main function to run the benchmarks.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the question engine on synthetic banks.")
+    parser.add_argument("--sizes", nargs="+", type=lambda s: int(float(s)), default=[1000, 10000, 100000], help="Bank sizes in rows, e.g. 1e3 1e7.")
+    parser.add_argument("--domains", type=int, default=10, help="Distinct domains.")
+    parser.add_argument("--stakeholders", type=int, default=9, help="Distinct stakeholders.")
+    parser.add_argument("--metrics", type=int, default=24, help="Distinct metric areas.")
+    parser.add_argument("--types", type=int, default=6, help="Distinct question types.")
+    parser.add_argument("--queries", type=int, default=50, help="Random selections per filtering and cascade stage.")
+    parser.add_argument("--stages", nargs="+", help="Only run these stages.")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per stage, the fastest is reported.")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed.")
+    parser.add_argument("--no-memory", dest="memory", action="store_false", help="Skip the peak memory runs.")
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout.")
+    parser.add_argument("--baseline", help="Compare with a JSON report from an earlier run.")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative slowdown (default: 0.25).")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as folder:
+        check_description_reload(folder)
+        results = [result for rows in args.sizes for result in bench_size(rows, folder, args)]
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "options": {k: v for k, v in vars(args).items() if k not in ("output", "baseline")},
+        },
+        "results": results,
+    }
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            report["comparison"] = compare(results, json.load(f), args.tolerance)
+        regressions = [c for c in report["comparison"] if c["regression"]]
+        for c in regressions:
+            print(f"REGRESSION {c['rows']} {c['stage']}: {c['ratio']:.2f}x baseline", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,265 @@
+"""
+This module precomputes question packs for every combination of Domain, Stakeholder, Metric Area and
+Question Type that occurs in the question bank, for every timeline the app offers (3 to 60 months).
+Combinations are spread over a process pool. Workers map the compiled catalog instead of loading the
+bank, and each task only carries the row ids of its combination. A manifest records the content digest
+of every finished combination, so an interrupted run resumes where it stopped and a rerun only
+regenerates the combinations whose questions changed. Usage:
+
+    python bulk_generate.py --out packs/ --format csv parquet --workers 8
+"""
+
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import Counter
+
+import question_engine
+from batch_generate import safe_name
+from catalog import Catalog
+from export import FORMATS, write_export
+from facet_index import FACET_COLUMNS
+
+# Bump when the content of the packs changes for the same questions, to regenerate every pack
+PACK_FORMAT = 1
+MANIFEST_NAME = "manifest.jsonl"
+
+# The bank of the worker process, mapped once by init_worker
+_bank = None
+
+
+def parse_timelines(text):
+    """
+    Parse a timeline range such as "3-60" or a list such as "3,6,12".
+
+    Args:
+        text (str): The timelines.
+
+    Returns:
+        list: The timelines in months.
+    """
+    timelines = []
+    for part in text.split(","):
+        first, _, last = part.partition("-")
+        timelines.extend(range(int(first), int(last or first) + 1))
+    return sorted(set(timelines))
+
+
+def reachable_combinations(bank):
+    """
+    Group the rows of the question bank by their facet values.
+
+    Args:
+        bank (pd.DataFrame or CatalogTable): The question bank.
+
+    Returns:
+        list: One (values, ids) pair per combination that occurs in the bank, with the ids in bank order.
+    """
+    facets = question_engine.select_rows(bank, columns=FACET_COLUMNS)
+    groups = facets.groupby(list(FACET_COLUMNS), observed=True, sort=False).indices
+    ids = facets.index.to_numpy()
+    return [(tuple(values), ids[positions]) for values, positions in groups.items()]
+
+
+def combination_digest(hashes, ids, timelines, formats, folder):
+    """
+    Get a digest of everything a combination's packs are generated from.
+
+    Args:
+        hashes (pd.Series): The content hash of every row of the bank, indexed by row id.
+        ids (np.ndarray): The row ids of the combination.
+        timelines (list): The timelines.
+        formats (list): The export formats.
+        folder (str): The folder of the packs, relative to the output folder.
+
+    Returns:
+        str: The hex digest.
+    """
+    digest = hashlib.sha1(json.dumps([PACK_FORMAT, timelines, sorted(formats), folder]).encode("utf-8"))
+    digest.update(hashes.loc[ids].to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def folder_names(values):
+    """
+    Get a distinct folder name for every value of a facet. Values that safe_name reduces to the same
+    name, ignoring case for case-insensitive filesystems, get a short hash of the value appended.
+
+    Args:
+        values (iterable): The distinct values of the facet.
+
+    Returns:
+        dict: Maps each value to its folder name.
+    """
+    names = {value: safe_name(value, "_") for value in values}
+    counts = Counter(name.casefold() for name in names.values())
+    return {
+        value: name if counts[name.casefold()] == 1 else f"{name}-{hashlib.sha1(str(value).encode('utf-8')).hexdigest()[:8]}"
+        for value, name in names.items()
+    }
+
+
+def pack_folder(values, names):
+    """
+    Get the folder of a combination's packs.
+
+    Args:
+        values (tuple): The facet values of the combination.
+        names (list): The folder_names of each facet.
+
+    Returns:
+        str: The folder relative to the output folder, one level per facet.
+    """
+    return os.path.join(*(facet_names[value] for value, facet_names in zip(values, names)))
+
+
+def read_manifest(path):
+    """
+    Read the finished combinations of earlier runs.
+
+    Args:
+        path (str): Path to the manifest.
+
+    Returns:
+        dict: Maps each finished combination to its manifest entry, the latest entry winning.
+    """
+    finished = {}
+    if not os.path.exists(path):
+        return finished
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # The last line of an interrupted run may be cut short
+                continue
+            finished[tuple(entry["combination"])] = entry
+    return finished
+
+
+def is_up_to_date(entry, digest, out):
+    """
+    Check whether the packs of a finished combination are still current.
+
+    Args:
+        entry (dict): The manifest entry of the combination, or None.
+        digest (str): The current digest of the combination.
+        out (str): The output folder.
+
+    Returns:
+        bool: Whether the digest is unchanged and every pack still exists.
+    """
+    if entry is None or entry["digest"] != digest:
+        return False
+    return all(os.path.exists(os.path.join(out, path)) for path in entry["files"])
+
+
+def init_worker(catalog_file):
+    """
+    Map the catalog in a worker process.
+
+    Args:
+        catalog_file (str): Path to the compiled catalog.
+    """
+    global _bank
+    _bank = Catalog(catalog_file).tables["bank"]
+
+
+def write_packs(task):
+    """
+    Write the packs of one combination for every timeline and format.
+
+    Args:
+        task (tuple): The combination values, its row ids, its digest, the output folder, the folder of
+            its packs relative to it, the timelines and the formats.
+
+    Returns:
+        dict: The manifest entry of the combination.
+    """
+    values, ids, digest, out, folder, timelines, formats = task
+    folder = os.path.join(out, folder)
+    os.makedirs(folder, exist_ok=True)
+    data_df = question_engine.questions_frame(question_engine.select_rows(_bank, ids), timelines[0])
+    files = []
+    for timeline in timelines:
+        # Packs of one combination only differ in the timeline column
+        data_df["timeline (in months)"] = timeline
+        for fmt in formats:
+            path = os.path.join(folder, f"questions-{timeline}m.{FORMATS[fmt][0]}")
+            write_export(data_df, fmt, path)
+            files.append(os.path.relpath(path, out))
+    return {"combination": list(values), "digest": digest, "questions": len(ids), "files": files}
+
+
+def main(argv=None):
+    """
+    The main function to run the bulk generation.
+    """
+    parser = argparse.ArgumentParser(description="Generate question packs for every reachable facet combination and timeline.")
+    parser.add_argument("--out", default="packs", help="Output folder (default: packs).")
+    parser.add_argument("--format", nargs="+", choices=list(FORMATS), default=["csv"], help="Output formats.")
+    parser.add_argument("--timelines", type=parse_timelines, default=parse_timelines("3-60"), help="Timelines in months, e.g. 3-60 or 3,6,12 (default: 3-60).")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Worker processes (default: one per CPU).")
+    parser.add_argument("--force", action="store_true", help="Regenerate every combination, ignoring the manifest.")
+    parser.add_argument("--personal", action="store_true", help="Also write the personal questions once.")
+    parser.add_argument("--main-db", default=question_engine.MAIN_DB_PATH, help="Path to the main question bank.")
+    parser.add_argument("--personal-db", default=question_engine.PERSONAL_DB_PATH, help="Path to the personal questions.")
+    args = parser.parse_args(argv)
+
+    catalog = question_engine.load_catalog(args.main_db, args.personal_db)
+    bank = catalog.tables["bank"]
+    hashes = question_engine.row_hashes(bank.frame())
+    os.makedirs(args.out, exist_ok=True)
+    manifest_path = os.path.join(args.out, MANIFEST_NAME)
+    finished = {} if args.force else read_manifest(manifest_path)
+
+    tasks = []
+    combinations = reachable_combinations(bank)
+    names = [folder_names({values[i] for values, _ in combinations}) for i in range(len(FACET_COLUMNS))]
+    for values, ids in combinations:
+        folder = pack_folder(values, names)
+        digest = combination_digest(hashes, ids, args.timelines, args.format, folder)
+        if not is_up_to_date(finished.get(values), digest, args.out):
+            tasks.append((values, ids, digest, args.out, folder, args.timelines, args.format))
+    print(f"{len(combinations)} combinations, {len(combinations) - len(tasks)} up to date, {len(tasks)} to generate", file=sys.stderr)
+
+    if args.personal:
+        personal_questions_df = question_engine.generate_personal_questions(catalog=catalog)
+        for fmt in args.format:
+            write_export(personal_questions_df, fmt, os.path.join(args.out, f"personalQuestions.{FORMATS[fmt][0]}"))
+
+    if tasks:
+        start = last_report = time.perf_counter()
+        workers = max(min(args.workers or 1, len(tasks)), 1)
+        with open(manifest_path, "a", encoding="utf-8") as manifest:
+            if workers == 1:
+                init_worker(catalog.path)
+                results = map(write_packs, tasks)
+                pool = None
+            else:
+                pool = multiprocessing.Pool(workers, initializer=init_worker, initargs=(catalog.path,))
+                results = pool.imap_unordered(write_packs, tasks, chunksize=max(len(tasks) // (workers * 16), 1))
+            try:
+                for done, entry in enumerate(results, start=1):
+                    # Each finished combination is recorded at once, so an interrupted run resumes after it
+                    manifest.write(json.dumps(entry) + "\n")
+                    manifest.flush()
+                    now = time.perf_counter()
+                    if now - last_report >= 1 or done == len(tasks):
+                        last_report = now
+                        remaining = (now - start) / done * (len(tasks) - done)
+                        print(f"{done}/{len(tasks)} combinations, {now - start:.1f}s elapsed, {remaining:.1f}s remaining", file=sys.stderr)
+            finally:
+                if pool is not None:
+                    pool.terminate()
+                    pool.join()
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
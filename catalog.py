@@ -0,0 +1,319 @@
+"""
+This module compiles the question banks into one read-only catalog file and maps it into memory.
+The catalog holds the main question bank, the personal questions and the description texts of
+lookup_dicts.py. Categorical columns are stored as integer codes, integer columns as they are and
+text columns as packed UTF-8, so a process opens the catalog with mmap instead of parsing it: its
+arrays are views of the operating system page cache, shared by every server process on the host,
+and text is only decoded for the rows that are read.
+
+The file starts with a magic number and the length of a JSON header describing every array, followed
+by the header and the arrays, each aligned to 64 bytes.
+"""
+
+import json
+import mmap
+import os
+
+import numpy as np
+import pandas as pd
+
+CATALOG_MAGIC = b"QGCATLG\x00"
+CATALOG_FORMAT = 2
+ALIGNMENT = 64
+
+
+def _align(offset):
+    """
+    Round an offset up to the array alignment.
+
+    Args:
+        offset (int): The offset in bytes.
+
+    Returns:
+        int: The aligned offset.
+    """
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def _text_arrays(prefix, values):
+    """
+    Encode strings as one NUL separated UTF-8 buffer with the byte offset of each string.
+
+    Args:
+        prefix (str): The name prefix of the arrays.
+        values (pd.Series): The strings, possibly with missing values.
+
+    Returns:
+        dict: The data, offsets and missing arrays, by name.
+    """
+    missing = values.isna().to_numpy()
+    encoded = [value.encode("utf-8") for value in values.where(~missing, "").astype(str)]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    # Each string is followed by a NUL, so a whole column decodes with one split
+    np.cumsum(np.fromiter((len(value) + 1 for value in encoded), dtype=np.int64, count=len(encoded)), out=offsets[1:])
+    return {
+        f"{prefix}/data": np.frombuffer(b"\0".join(encoded), dtype=np.uint8),
+        f"{prefix}/offsets": offsets,
+        f"{prefix}/missing": missing,
+    }
+
+
+def write_catalog(path, version, tables):
+    """
+    Write DataFrames to a catalog file, replacing any previous one atomically.
+
+    Args:
+        path (str): Path to the catalog file.
+        version (str): Version of the sources the catalog is built from.
+        tables (dict): Maps table names to DataFrames with integer indexes. Categorical columns are
+            stored as codes, integer columns as int64 and every other column as text.
+    """
+    arrays = {}
+    header = {"format": CATALOG_FORMAT, "version": version, "tables": {}, "arrays": {}}
+    for name, df in tables.items():
+        index = np.asarray(df.index, dtype=np.int64)
+        arrays[f"{name}/index"] = index
+        spec = {
+            "rows": len(df),
+            "contiguous": bool(np.array_equal(index, np.arange(len(index)))),
+            "columns": [],
+        }
+        for i, column in enumerate(df.columns):
+            prefix = f"{name}/{i}"
+            values = df[column]
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                arrays[f"{prefix}/codes"] = values.cat.codes.to_numpy()
+                arrays.update(_text_arrays(f"{prefix}/categories", pd.Series(values.cat.categories.astype(str))))
+                kind = "category"
+            elif pd.api.types.is_integer_dtype(values.dtype):
+                arrays[f"{prefix}/values"] = values.to_numpy(dtype=np.int64)
+                kind = "int"
+            else:
+                arrays.update(_text_arrays(prefix, values))
+                kind = "text"
+            spec["columns"].append({"name": column, "kind": kind, "prefix": prefix})
+        header["tables"][name] = spec
+
+    offset = 0
+    for name, array in arrays.items():
+        header["arrays"][name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset = _align(offset + array.nbytes)
+    encoded_header = json.dumps(header).encode("utf-8")
+    start = _align(len(CATALOG_MAGIC) + 8 + len(encoded_header))
+
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(CATALOG_MAGIC)
+        f.write(len(encoded_header).to_bytes(8, "little"))
+        f.write(encoded_header)
+        for name, array in arrays.items():
+            f.seek(start + header["arrays"][name]["offset"])
+            f.write(np.ascontiguousarray(array).data)
+        # Pad to the end of the last array, so empty arrays at the end still map
+        f.truncate(max(start + offset, 1))
+    os.replace(temp_path, path)
+
+
+class TextColumn:
+    """
+    Packed text column of a catalog, decoded on access.
+    """
+
+    def __init__(self, catalog, prefix):
+        """
+        Args:
+            catalog (Catalog): The open catalog.
+            prefix (str): The name prefix of the column arrays.
+        """
+        self._buffer = catalog._buffer
+        self._start = catalog._offset(f"{prefix}/data")
+        self.offsets = catalog.array(f"{prefix}/offsets")
+        self.missing = catalog.array(f"{prefix}/missing")
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def take(self, positions=None):
+        """
+        Decode some or all of the strings.
+
+        Args:
+            positions (np.ndarray): Positions of the strings to decode, or None for all.
+
+        Returns:
+            np.ndarray: The strings as an object array, with NaN for missing values.
+        """
+        if positions is None:
+            size = int(self.offsets[-1]) - 1
+            values = self._buffer[self._start:self._start + size].decode("utf-8").split("\0") if len(self) else []
+            missing = self.missing
+        else:
+            starts = (self.offsets[positions] + self._start).tolist()
+            ends = (self.offsets[positions + 1] + self._start - 1).tolist()
+            values = [self._buffer[start:end].decode("utf-8") for start, end in zip(starts, ends)]
+            missing = self.missing[positions]
+        result = np.empty(len(values), dtype=object)
+        result[:] = values
+        result[missing] = np.nan
+        return result
+
+
+class CatalogTable:
+    """
+    One table of a catalog, keyed by row id (the index label of the DataFrame it was written from).
+    """
+
+    def __init__(self, catalog, spec):
+        """
+        Args:
+            catalog (Catalog): The open catalog.
+            spec (dict): The table description from the catalog header.
+        """
+        self._catalog = catalog
+        self._columns = {column["name"]: column for column in spec["columns"]}
+        self._contiguous = spec["contiguous"]
+        self._categories = {}
+        self._lookup = None
+        self.index = catalog.array(f"{spec['prefix']}/index")
+        self.columns = list(self._columns)
+
+    def __len__(self):
+        return len(self.index)
+
+    def positions(self, ids):
+        """
+        Get the positions of rows in the table.
+
+        Args:
+            ids (array-like): The row ids.
+
+        Returns:
+            np.ndarray: The positions.
+
+        Raises:
+            KeyError: If a row id is not in the table.
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        if self._contiguous:
+            positions = np.where((ids >= 0) & (ids < len(self.index)), ids, -1)
+        else:
+            if self._lookup is None:
+                self._lookup = pd.Index(self.index)
+            positions = self._lookup.get_indexer(ids)
+        if (positions < 0).any():
+            raise KeyError(f"Row ids not in the catalog: {ids[positions < 0].tolist()}")
+        return positions
+
+    def categories(self, column):
+        """
+        Get the categories of a categorical column, decoded once per process.
+
+        Args:
+            column (str): The column name.
+
+        Returns:
+            list: The categories, in code order.
+        """
+        if column not in self._categories:
+            prefix = self._columns[column]["prefix"]
+            self._categories[column] = TextColumn(self._catalog, f"{prefix}/categories").take().tolist()
+        return self._categories[column]
+
+    def column(self, column, positions=None):
+        """
+        Get the values of one column.
+
+        Args:
+            column (str): The column name.
+            positions (np.ndarray): Positions of the rows, or None for all rows.
+
+        Returns:
+            pd.Categorical or np.ndarray: The values. Categorical codes and integers are views of the catalog.
+        """
+        spec = self._columns[column]
+        if spec["kind"] == "int":
+            values = self._catalog.array(f"{spec['prefix']}/values")
+            return values if positions is None else values[positions]
+        if spec["kind"] == "category":
+            codes = self._catalog.array(f"{spec['prefix']}/codes")
+            if positions is not None:
+                codes = codes[positions]
+            return pd.Categorical.from_codes(codes, self.categories(column))
+        return TextColumn(self._catalog, spec["prefix"]).take(positions)
+
+    def frame(self, ids=None, columns=None):
+        """
+        Build a DataFrame from some rows and columns of the table.
+
+        Args:
+            ids (array-like): The row ids, in output order, or None for all rows.
+            columns (list): The columns, or None for all columns.
+
+        Returns:
+            pd.DataFrame: The rows, indexed by row id.
+        """
+        if ids is None:
+            positions, index = None, self.index
+        else:
+            positions = self.positions(ids)
+            index = self.index[positions]
+        return pd.DataFrame(
+            {column: self.column(column, positions) for column in (self.columns if columns is None else columns)},
+            index=pd.Index(index),
+        )
+
+
+class Catalog:
+    """
+    Read-only, memory-mapped catalog file.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): Path to the catalog file.
+
+        Raises:
+            ValueError: If the file is not a catalog or was written in another format.
+        """
+        with open(path, "rb") as f:
+            self._buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._buffer[:len(CATALOG_MAGIC)] != CATALOG_MAGIC:
+            raise ValueError(f"{path} is not a question catalog")
+        length = int.from_bytes(self._buffer[len(CATALOG_MAGIC):len(CATALOG_MAGIC) + 8], "little")
+        start = len(CATALOG_MAGIC) + 8
+        header = json.loads(self._buffer[start:start + length])
+        if header.get("format") != CATALOG_FORMAT:
+            raise ValueError(f"{path} has catalog format {header.get('format')}, expected {CATALOG_FORMAT}")
+        self._start = _align(start + length)
+        self._arrays = header["arrays"]
+        self.path = path
+        self.version = header["version"]
+        self.tables = {name: CatalogTable(self, {**spec, "prefix": name}) for name, spec in header["tables"].items()}
+
+    def _offset(self, name):
+        """
+        Get the file offset of an array.
+
+        Args:
+            name (str): The array name.
+
+        Returns:
+            int: The offset in bytes.
+        """
+        return self._start + self._arrays[name]["offset"]
+
+    def array(self, name):
+        """
+        Get an array of the catalog without copying it.
+
+        Args:
+            name (str): The array name.
+
+        Returns:
+            np.ndarray: A read-only view of the mapped file.
+        """
+        spec = self._arrays[name]
+        count = int(np.prod(spec["shape"], dtype=np.int64))
+        array = np.frombuffer(self._buffer, dtype=np.dtype(spec["dtype"]), count=count, offset=self._offset(name))
+        return array.reshape(spec["shape"])
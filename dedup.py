@@ -0,0 +1,319 @@
+"""
+This module finds near-duplicate questions with MinHash signatures and LSH banding.
+Signatures are computed once per distinct question text, and questions whose signatures share a band
+are compared and clustered, so no pass ever compares every pair of questions. Generated question sets
+can then be flagged or collapsed, and a report of the duplicate groups in the whole bank can be written:
+
+    python dedup.py --threshold 0.8 --out duplicates.csv
+"""
+
+import argparse
+import re
+import sys
+import zlib
+
+import numpy as np
+import pandas as pd
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+PRIME = np.uint64(4294967291)  # Largest prime below 2**32
+
+
+def normalize(text):
+    """
+    Normalize question text for comparison.
+
+    Args:
+        text (str): The question text. Missing values become an empty string.
+
+    Returns:
+        str: The lowercase words separated by single spaces.
+    """
+    if not isinstance(text, str):
+        return ""
+    return " ".join(WORD_PATTERN.findall(text.lower()))
+
+
+def shingle_hashes(text):
+    """
+    Hash the word bigrams of normalized text, or its only word if it has one.
+
+    Args:
+        text (str): The normalized text.
+
+    Returns:
+        list: The distinct 32-bit shingle hashes.
+    """
+    words = text.split()
+    shingles = [f"{a} {b}" for a, b in zip(words, words[1:])] or words or [""]
+    return list({zlib.crc32(shingle.encode("utf-8")) for shingle in shingles})
+
+
+class DuplicateIndex:
+    """
+    MinHash/LSH index over question texts, keyed by row id (the index label of the question bank).
+
+    Rows with the same normalized text share one signature. Each text joins the group of the first earlier
+    text that shares an LSH band with it, leads its own group and is at least threshold similar; otherwise
+    it leads a new group. Every member is therefore directly similar to its group's first text, and
+    groups never chain through intermediate questions.
+    """
+
+    def __init__(self, num_perm=128, bands=16, threshold=0.8, seed=1):
+        """
+        Args:
+            num_perm (int): The number of MinHash permutations.
+            bands (int): The number of LSH bands; num_perm must be a multiple of it.
+            threshold (float): The estimated Jaccard similarity from which texts are duplicates.
+            seed (int): The seed of the permutations.
+        """
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.bands = bands
+        self.threshold = threshold
+        rng = np.random.default_rng(seed)
+        # Multipliers below 2**31 keep a * x + b below 2**64 for 32-bit x
+        self.a = rng.integers(1, 2 ** 31, num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, 2 ** 31, num_perm, dtype=np.uint64)
+        self.texts = {}
+        self.signatures = np.zeros((0, num_perm), dtype=np.uint32)
+        self.band_keys = np.zeros((0, bands), dtype=np.uint64)
+        self.parent = np.zeros(0, dtype=np.int64)
+        self.row_text = np.zeros(0, dtype=np.int64)
+
+    @classmethod
+    def from_frame(cls, db, column="Question", **kwargs):
+        """
+        Build the index over a question bank.
+
+        Args:
+            db (pd.DataFrame): The question bank, indexed by non-negative integer row ids.
+            column (str): The text column to compare.
+            **kwargs: Parameters passed to the constructor.
+
+        Returns:
+            DuplicateIndex: The built index.
+        """
+        index = cls(**kwargs)
+        index.add(np.asarray(db.index, dtype=np.int64), db[column].tolist())
+        return index
+
+    def copy(self):
+        """
+        Get a copy that can be updated without affecting this index.
+
+        Returns:
+            DuplicateIndex: The copy, sharing the arrays, which updates replace instead of modifying.
+        """
+        clone = DuplicateIndex.__new__(DuplicateIndex)
+        clone.__dict__.update(self.__dict__)
+        clone.texts = dict(self.texts)
+        return clone
+
+    def _signatures(self, texts, batch=20000):
+        """
+        Compute the MinHash signatures of normalized texts.
+
+        Args:
+            texts (list): The normalized texts.
+            batch (int): The number of texts hashed per vectorized batch.
+
+        Returns:
+            np.ndarray: One row of num_perm uint32 minima per text.
+        """
+        signatures = np.empty((len(texts), len(self.a)), dtype=np.uint32)
+        for start in range(0, len(texts), batch):
+            hashes = [shingle_hashes(text) for text in texts[start:start + batch]]
+            counts = np.fromiter((len(h) for h in hashes), dtype=np.int64, count=len(hashes))
+            offsets = np.concatenate([[0], np.cumsum(counts)[:-1]])
+            values = np.fromiter((v for h in hashes for v in h), dtype=np.uint64, count=int(counts.sum()))
+            for j in range(len(self.a)):
+                permuted = (self.a[j] * values + self.b[j]) % PRIME
+                signatures[start:start + len(hashes), j] = np.minimum.reduceat(permuted, offsets)
+        return signatures
+
+    def _band_keys(self, signatures):
+        """
+        Hash each LSH band of the signatures into one 64-bit key.
+
+        Args:
+            signatures (np.ndarray): The signatures.
+
+        Returns:
+            np.ndarray: One key per text and band.
+        """
+        rows = signatures.shape[1] // self.bands
+        bands = signatures.reshape(len(signatures), self.bands, rows).astype(np.uint64)
+        keys = np.zeros((len(signatures), self.bands), dtype=np.uint64)
+        with np.errstate(over="ignore"):
+            for r in range(rows):
+                keys = keys * np.uint64(1000003) + bands[:, :, r]
+        return keys
+
+    def add(self, ids, texts):
+        """
+        Index new rows. Ids that are already indexed are re-pointed at their new text.
+
+        Args:
+            ids (array-like): The row ids.
+            texts (list): The question text of each row.
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        normalized = [normalize(text) for text in texts]
+        known = self.texts.copy()
+        new_texts = []
+        row_text = np.empty(len(ids), dtype=np.int64)
+        for position, text in enumerate(normalized):
+            code = known.get(text)
+            if code is None:
+                code = known[text] = len(self.parent) + len(new_texts)
+                new_texts.append(text)
+            row_text[position] = code
+
+        if new_texts:
+            old_count = len(self.parent)
+            signatures = self._signatures(new_texts)
+            band_keys = self._band_keys(signatures)
+            self.signatures = np.concatenate([self.signatures, signatures])
+            self.band_keys = np.concatenate([self.band_keys, band_keys])
+            parent = np.concatenate([self.parent, np.arange(old_count, len(known), dtype=np.int64)])
+
+            # Candidate pairs: every text and the first text sharing one of its band keys
+            firsts = []
+            for band in range(self.bands):
+                _, first, inverse = np.unique(self.band_keys[:, band], return_index=True, return_inverse=True)
+                firsts.append(first[inverse.ravel()])
+            members = np.tile(np.arange(len(parent)), self.bands)
+            firsts = np.concatenate(firsts)
+            pairs = (firsts != members) & (members >= old_count)
+            pairs = np.unique(np.stack([firsts[pairs], members[pairs]], axis=1), axis=0)
+            if len(pairs):
+                similarity = (self.signatures[pairs[:, 0]] == self.signatures[pairs[:, 1]]).mean(axis=1)
+                verified = pairs[similarity >= self.threshold]
+                # Visit members in order so every earlier text already knows whether it leads a group
+                for first, member in verified[np.lexsort((verified[:, 0], verified[:, 1]))].tolist():
+                    if parent[member] == member and parent[first] == first:
+                        parent[member] = first
+            self.parent = parent
+
+        capacity = max(len(self.row_text), int(ids.max()) + 1 if ids.size else 0)
+        all_row_text = np.full(capacity, -1, dtype=np.int64)
+        all_row_text[:len(self.row_text)] = self.row_text
+        all_row_text[ids] = row_text
+        self.row_text = all_row_text
+        self.texts = known
+
+    def remove(self, ids):
+        """
+        Remove rows from the index. Their texts stay known, so re-adding them is cheap.
+
+        Args:
+            ids (array-like): The row ids.
+        """
+        row_text = self.row_text.copy()
+        row_text[np.asarray(ids, dtype=np.int64)] = -1
+        self.row_text = row_text
+
+    def groups(self, ids):
+        """
+        Get the duplicate group of each row.
+
+        Args:
+            ids (array-like): Row ids present in the index.
+
+        Returns:
+            np.ndarray: One group label per row; rows with equal labels are near-duplicates.
+        """
+        return self.parent[self.row_text[np.asarray(ids, dtype=np.int64)]]
+
+    def similarity(self, first, second):
+        """
+        Get the estimated Jaccard similarity of the texts of two rows.
+
+        Args:
+            first (int): A row id.
+            second (int): Another row id.
+
+        Returns:
+            float: The estimated similarity.
+        """
+        a, b = self.row_text[first], self.row_text[second]
+        return float((self.signatures[a] == self.signatures[b]).mean())
+
+    def report(self, db, column="Question"):
+        """
+        List every group of near-duplicate questions in a question bank.
+
+        Args:
+            db (pd.DataFrame): The question bank this index was built from.
+            column (str): The text column that was compared.
+
+        Returns:
+            pd.DataFrame: One row per duplicated question with its group, the first question of the group
+            and their estimated similarity, largest groups first.
+        """
+        ids = np.asarray(db.index, dtype=np.int64)
+        groups = pd.Series(self.groups(ids), index=db.index)
+        sizes = groups.map(groups.value_counts())
+        duplicated = db[sizes > 1]
+        group = groups[sizes > 1]
+        first = group.index.to_series().groupby(group.to_numpy()).transform("first")
+        report = pd.DataFrame({
+            "group": group,
+            "group_size": sizes[sizes > 1],
+            "first_row": first,
+            "similarity": [self.similarity(row, head) for row, head in zip(first.index, first)],
+            "first_question": db.loc[first.to_numpy(), column].to_numpy(),
+        })
+        report = pd.concat([duplicated, report], axis=1)
+        return report.sort_values(["group_size", "group"], ascending=[False, True], kind="stable")
+
+
+def mark_duplicates(data_df, duplicate_index, mode="flag"):
+    """
+    Flag or collapse near-duplicate questions in a generated question set.
+
+    Args:
+        data_df (pd.DataFrame): Generated questions, indexed by question bank row id.
+        duplicate_index (DuplicateIndex): The duplicate index of the question bank.
+        mode (str): "flag" to add a "duplicate of" column with the row_number of the first question of
+            each group, or "collapse" to keep only that first question.
+
+    Returns:
+        pd.DataFrame: The flagged or collapsed questions.
+    """
+    groups = pd.Series(duplicate_index.groups(data_df.index), index=data_df.index)
+    first = groups.duplicated()
+    if mode == "collapse":
+        collapsed = data_df[~first.to_numpy()].copy()
+        collapsed["row_number"] = range(0, len(collapsed))
+        return collapsed
+    if mode != "flag":
+        raise ValueError(f"Unknown mode {mode!r}, expected 'flag' or 'collapse'")
+    first_row_number = data_df["row_number"].groupby(groups.to_numpy()).transform("first")
+    flagged = data_df.copy()
+    flagged["duplicate of"] = first_row_number.where(first.to_numpy()).astype("Int64")
+    return flagged
+
+
+def main(argv=None):
+    """
+    The main function to write the duplicate report of the question bank.
+    """
+    import question_engine
+
+    parser = argparse.ArgumentParser(description="Report near-duplicate questions in the question bank.")
+    parser.add_argument("--main-db", default=question_engine.MAIN_DB_PATH, help="Path to the main question bank.")
+    parser.add_argument("--threshold", type=float, default=0.8, help="Estimated Jaccard similarity threshold (default: 0.8).")
+    parser.add_argument("--out", help="Write the report as CSV to this file instead of stdout.")
+    args = parser.parse_args(argv)
+
+    db = question_engine.load_data(args.main_db)
+    report = DuplicateIndex.from_frame(db, threshold=args.threshold).report(db)
+    print(f"{report['group'].nunique()} duplicate groups covering {len(report)} of {len(db)} questions", file=sys.stderr)
+    report.to_csv(args.out if args.out else sys.stdout)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+"""
+This module keeps user edits to generated questions as a patch log instead of an edited copy.
+The log maps row numbers to the fields changed in that row and is only applied as an overlay
+when the edited data is viewed or exported.
+"""
+
+import pandas as pd
+
+
+class PatchLog:
+    """
+    Per-session log of edited fields, keyed by row number (position in the generated data).
+    """
+
+    def __init__(self):
+        self.patches = {}
+
+    def __len__(self):
+        return len(self.patches)
+
+    def set(self, row, field, value, original):
+        """
+        Record a new value for one field, dropping the patch if it restores the original.
+
+        Args:
+            row (int): The row number.
+            field (str): The column name.
+            value: The new value.
+            original: The unedited value, used to tell whether the field is still modified.
+        """
+        fields = self.patches.setdefault(row, {})
+        if value == original or (pd.isna(value) and pd.isna(original)):
+            fields.pop(field, None)
+        else:
+            fields[field] = value
+        if not fields:
+            del self.patches[row]
+
+    def update(self, row, values, originals):
+        """
+        Record new values for several fields of one row.
+
+        Args:
+            row (int): The row number.
+            values (dict): Maps column names to new values.
+            originals (dict): Maps column names to their unedited values.
+        """
+        for field, value in values.items():
+            self.set(row, field, value, originals[field])
+
+    def get(self, row, field, default=None):
+        """
+        Get the edited value of a field.
+
+        Args:
+            row (int): The row number.
+            field (str): The column name.
+            default: Returned when the field has not been edited.
+
+        Returns:
+            The edited value, or default.
+        """
+        return self.patches.get(row, {}).get(field, default)
+
+    def clear(self):
+        """Discard every edit."""
+        self.patches.clear()
+
+    def view(self, df, rows):
+        """
+        Get some rows of the data with the edits applied, copying only those rows.
+
+        Args:
+            df (pd.DataFrame): The unedited data.
+            rows (list): The row numbers to view.
+
+        Returns:
+            pd.DataFrame: The edited rows.
+        """
+        return self._overlay(df.iloc[list(rows)].copy(), rows=list(rows))
+
+    def apply(self, df):
+        """
+        Get the whole data with the edits applied. The data is only copied when there are edits.
+
+        Args:
+            df (pd.DataFrame): The unedited data.
+
+        Returns:
+            pd.DataFrame: The edited data.
+        """
+        if not self.patches:
+            return df
+        return self._overlay(df.copy(), rows=None)
+
+    def _overlay(self, df, rows):
+        """
+        Write the patches into a DataFrame that is safe to modify.
+
+        Args:
+            df (pd.DataFrame): A copy of the rows to patch.
+            rows (list): Row numbers of the rows in df, or None if df holds every row.
+
+        Returns:
+            pd.DataFrame: df with the patches written in.
+        """
+        if rows is None:
+            positions = {row: row for row in self.patches if row < len(df)}
+        else:
+            positions = {row: i for i, row in enumerate(rows) if row in self.patches}
+        # Group by column so each column is written once, whatever the number of edited rows
+        by_field = {}
+        for row, position in positions.items():
+            for field, value in self.patches[row].items():
+                by_field.setdefault(field, ([], []))
+                by_field[field][0].append(position)
+                by_field[field][1].append(value)
+        for field, (field_positions, values) in by_field.items():
+            column = df.columns.get_loc(field)
+            if isinstance(df[field].dtype, pd.CategoricalDtype) and not set(values) <= set(df[field].cat.categories):
+                df[field] = df[field].astype(object)
+            df.iloc[field_positions, column] = values
+        return df
@@ -0,0 +1,300 @@
+"""
+This module streams generated questions out as CSV, NDJSON, JSON or Parquet, optionally gzip
+compressed. Payloads are produced chunk by chunk from generators, so they are only built when a
+download or file is actually requested and never need more than one chunk of encoded output at a time.
+JSON and NDJSON give the answer options of each question as a nested list, from the option sets.
+Parquet output needs pyarrow, which is installed alongside Streamlit.
+"""
+
+import io
+import os
+import zlib
+
+from answer_options import nested_options
+
+DEFAULT_CHUNKSIZE = 10000
+
+# Format name -> (file extension, MIME type)
+FORMATS = {
+    "csv": ("csv", "text/csv"),
+    "csv.gz": ("csv.gz", "application/gzip"),
+    "ndjson": ("ndjson", "application/x-ndjson"),
+    "ndjson.gz": ("ndjson.gz", "application/gzip"),
+    "json": ("json", "application/json"),
+    "parquet": ("parquet", "application/vnd.apache.parquet"),
+}
+
+
+def iter_frames(df, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Split a DataFrame into row chunks without copying it.
+
+    Args:
+        df (pd.DataFrame): The DataFrame to split.
+        chunksize (int): The number of rows per chunk.
+
+    Yields:
+        pd.DataFrame: Consecutive row slices of df.
+    """
+    for start in range(0, len(df), chunksize):
+        yield df.iloc[start:start + chunksize]
+
+
+def nest_options(df):
+    """
+    Replace the packed answer options of generated questions with lists of options.
+
+    Args:
+        df (pd.DataFrame): The DataFrame to encode.
+
+    Returns:
+        pd.DataFrame: df with an "options" column of lists, or df itself if it has no options.
+    """
+    if "options" not in df.columns:
+        return df
+    return df.assign(options=nested_options(df["options"]))
+
+
+def iter_csv(df, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Encode a DataFrame as utf-8 CSV, with the same layout as ``DataFrame.to_csv()``.
+
+    Args:
+        df (pd.DataFrame): The DataFrame to encode.
+        chunksize (int): The number of rows per chunk.
+
+    Yields:
+        bytes: Consecutive pieces of the CSV file.
+    """
+    yield df.iloc[:0].to_csv().encode('utf-8')
+    for chunk in iter_frames(df, chunksize):
+        yield chunk.to_csv(header=False).encode('utf-8')
+
+
+def iter_ndjson(df, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Encode a DataFrame as newline-delimited JSON, one object per row.
+
+    Args:
+        df (pd.DataFrame): The DataFrame to encode.
+        chunksize (int): The number of rows per chunk.
+
+    Yields:
+        bytes: Consecutive pieces of the NDJSON file.
+    """
+    for chunk in iter_frames(df, chunksize):
+        yield (nest_options(chunk).to_json(orient="records", lines=True).rstrip("\n") + "\n").encode('utf-8')
+
+
+def iter_json(df, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Encode a DataFrame as JSON, with the same column-oriented layout as ``DataFrame.to_json()``.
+    This layout nests every column, so it is encoded in one piece.
+
+    Args:
+        df (pd.DataFrame): The DataFrame to encode.
+        chunksize (int): Unused, accepted for a uniform signature.
+
+    Yields:
+        bytes: The JSON file.
+    """
+    yield nest_options(df).to_json().encode('utf-8')
+
+
+class _BufferSink:
+    """Write-only file object that hands over whatever was written since the last drain."""
+
+    def __init__(self):
+        self.closed = False
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def iter_parquet(df, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Encode a DataFrame as Parquet, writing one row group per chunk.
+
+    Args:
+        df (pd.DataFrame): The DataFrame to encode.
+        chunksize (int): The number of rows per row group.
+
+    Yields:
+        bytes: Consecutive pieces of the Parquet file.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    sink = _BufferSink()
+    schema = pa.Schema.from_pandas(df, preserve_index=True)
+    with pq.ParquetWriter(pa.PythonFile(sink, mode="w"), schema) as writer:
+        for chunk in iter_frames(df, chunksize):
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=True))
+            yield sink.drain()
+    yield sink.drain()
+
+
+def gzip_chunks(chunks, level=6):
+    """
+    Gzip compress a stream of byte chunks.
+
+    Args:
+        chunks (iterable): The uncompressed byte chunks.
+        level (int): The compression level.
+
+    Yields:
+        bytes: Consecutive pieces of the gzip file.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+ENCODERS = {
+    "csv": iter_csv,
+    "ndjson": iter_ndjson,
+    "json": iter_json,
+    "parquet": iter_parquet,
+}
+
+
+def iter_export(df, fmt, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Encode a DataFrame in one of the export formats.
+
+    Args:
+        df (pd.DataFrame): The DataFrame to encode.
+        fmt (str): One of the keys of FORMATS.
+        chunksize (int): The number of rows per chunk.
+
+    Yields:
+        bytes: Consecutive pieces of the exported file.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format {fmt!r}, expected one of {', '.join(FORMATS)}")
+    base, _, compression = fmt.partition(".")
+    chunks = ENCODERS[base](df, chunksize)
+    if compression == "gz":
+        chunks = gzip_chunks(chunks)
+    for chunk in chunks:
+        if chunk:
+            yield chunk
+
+
+def export_bytes(df, fmt, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Encode a DataFrame in one of the export formats as a single payload.
+
+    Args:
+        df (pd.DataFrame): The DataFrame to encode.
+        fmt (str): One of the keys of FORMATS.
+        chunksize (int): The number of rows per chunk.
+
+    Returns:
+        bytes: The exported file.
+    """
+    return b"".join(iter_export(df, fmt, chunksize))
+
+
+def write_export(df, fmt, path, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Stream a DataFrame to a file in one of the export formats. The file is replaced atomically, so
+    an interrupted write never leaves a partial file behind.
+
+    Args:
+        df (pd.DataFrame): The DataFrame to encode.
+        fmt (str): One of the keys of FORMATS.
+        path (str): The file to write.
+        chunksize (int): The number of rows per chunk.
+
+    Returns:
+        int: The number of bytes written.
+    """
+    written = 0
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, "wb") as f:
+            for chunk in iter_export(df, fmt, chunksize):
+                written += f.write(chunk)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return written
+
+
+class ExportReader(io.RawIOBase):
+    """
+    Read-only file object over an export stream, for consumers that want a file rather than
+    an iterator, such as ``st.download_button``.
+    """
+
+    def __init__(self, df, fmt, chunksize=DEFAULT_CHUNKSIZE, on_finish=None):
+        """
+        Args:
+            df (pd.DataFrame): The DataFrame to encode.
+            fmt (str): One of the keys of FORMATS.
+            chunksize (int): The number of rows per chunk.
+            on_finish (callable): Called once with the number of bytes read when the stream is exhausted.
+        """
+        self._chunks = iter_export(df, fmt, chunksize)
+        self._pending = memoryview(b"")
+        self._on_finish = on_finish
+        self.size = 0
+
+    def readable(self):
+        return True
+
+    def tell(self):
+        return self.size
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        """
+        Seek to the current position, which is all a forward-only stream supports. Streamlit
+        rewinds file objects before reading them, which is a no-op on an unread stream.
+
+        Raises:
+            io.UnsupportedOperation: If the offset is any other position.
+        """
+        position = {io.SEEK_SET: offset, io.SEEK_CUR: self.size + offset}.get(whence)
+        if position != self.size:
+            raise io.UnsupportedOperation("An export stream can only be read forward")
+        return position
+
+    def readinto(self, buffer):
+        while not self._pending:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                if self._on_finish is not None:
+                    on_finish, self._on_finish = self._on_finish, None
+                    on_finish(self.size)
+                return 0
+            # A view advances through the chunk without copying its remainder on every read
+            self._pending = memoryview(chunk)
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        self.size += size
+        return size
@@ -0,0 +1,256 @@
+"""
+This module builds a bitmap index over the facet columns of the question bank.
+Every distinct Domain, Stakeholder, Metric Area and Question Type value gets one bitset
+with a bit set for every row that carries it, so a selection becomes a few ORs and ANDs
+instead of a full scan of the DataFrame.
+"""
+
+import numpy as np
+import pandas as pd
+
+FACET_COLUMNS = ("Domain", "Stakeholder", "Metric Area", "Question Type")
+
+
+def bits_to_ids(bits):
+    """
+    Converts a bitset into the sorted array of row ids whose bits are set.
+
+    Args:
+        bits (int): The bitset, bit i standing for row id i.
+
+    Returns:
+        np.ndarray: The row ids as int64.
+    """
+    if not bits:
+        return np.empty(0, dtype=np.int64)
+    packed = np.frombuffer(bits.to_bytes((bits.bit_length() + 7) // 8, "little"), dtype=np.uint8)
+    return np.flatnonzero(np.unpackbits(packed, bitorder="little")).astype(np.int64)
+
+
+def ids_to_bits(ids):
+    """
+    Converts an array of row ids into a bitset.
+
+    Args:
+        ids (array-like): Non-negative integer row ids.
+
+    Returns:
+        int: The bitset with one bit set per row id.
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    if ids.size == 0:
+        return 0
+    mask = np.zeros(int(ids.max()) + 1, dtype=bool)
+    mask[ids] = True
+    return int.from_bytes(np.packbits(mask, bitorder="little").tobytes(), "little")
+
+
+class FacetIndex:
+    """
+    Bitmap index over the facet columns of the question bank.
+
+    Bitsets are plain Python integers where bit i stands for the row whose index label is i,
+    which keeps bitwise operations in C and makes the index cheap to share between sessions.
+    Values are returned in order of first appearance in the bank, matching ``Series.unique()``,
+    even after a reload has given edited rows ids out of bank order. Only those displaced rows are
+    looked up by position, every other row is still found by its lowest set bit.
+    """
+
+    def __init__(self, bitsets, live, order=None, displaced=0):
+        """
+        Args:
+            bitsets (dict): Maps each facet column to a dict of value -> bitset.
+            live (int): Bitset of every row id present in the bank.
+            order (np.ndarray): Position in the bank of each row id, or None when the rows are in row id order.
+            displaced (int): Bitset of the row ids out of bank order. The other rows are in row id order.
+        """
+        self.bitsets = bitsets
+        self.live = live
+        self.order = order
+        self.displaced = displaced
+        # Displaced bits are shifted down to the lowest displaced id before they are unpacked
+        self._displaced_low = (displaced & -displaced).bit_length() - 1 if displaced else 0
+
+    @classmethod
+    def from_frame(cls, db):
+        """
+        Builds the index from a question bank DataFrame.
+
+        Args:
+            db (pd.DataFrame): The question bank, indexed by non-negative integer row ids.
+
+        Returns:
+            FacetIndex: The built index, with the values in the row order of db.
+        """
+        ids = np.asarray(db.index, dtype=np.int64)
+        bitsets = {}
+        for column in FACET_COLUMNS:
+            values = db[column]
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                # Categorical columns are already normalized by the loader
+                codes, values = values.cat.codes.to_numpy(), list(values.cat.categories)
+            else:
+                codes, values = pd.factorize(values.astype(str).str.strip())
+            # Group the row ids by value code in one sort instead of one scan per value
+            order = np.argsort(codes, kind="stable")
+            bounds = np.searchsorted(codes[order], np.arange(len(values) + 1))
+            bitsets[column] = {
+                value: ids_to_bits(ids[order[bounds[i]:bounds[i + 1]]])
+                for i, value in enumerate(values)
+                if bounds[i] < bounds[i + 1]
+            }
+        index = cls(bitsets, ids_to_bits(ids))
+        index.set_bank_order(ids)
+        return index
+
+    def copy(self):
+        """
+        Get a copy that can be updated without affecting this index.
+
+        Returns:
+            FacetIndex: The copy, sharing the unchanged bitsets.
+        """
+        return FacetIndex({column: dict(values) for column, values in self.bitsets.items()}, self.live, self.order, self.displaced)
+
+    def set_bank_order(self, ids):
+        """
+        Set the order in which values are returned, after rows were added or removed.
+
+        Args:
+            ids (array-like): The row ids of the bank, in bank order.
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        if not len(ids) or (np.diff(ids) > 0).all():
+            # Row id order is bank order, so the lowest set bit is the first row
+            self.order, self.displaced, self._displaced_low = None, 0, 0
+            return
+        order = np.full(int(ids.max()) + 1, len(ids), dtype=np.int64)
+        order[ids] = np.arange(len(ids))
+        # A row is displaced if a later row has a lower id. Rows added or edited by a reload get ids
+        # above every other, so usually only they are displaced, and the others stay in row id order.
+        later_min = np.minimum.accumulate(ids[::-1])[::-1]
+        displaced = ids[:-1][ids[:-1] > later_min[1:]]
+        self.order = order
+        self.displaced = ids_to_bits(displaced)
+        self._displaced_low = int(displaced.min())
+
+    def add(self, db):
+        """
+        Index new rows.
+
+        Args:
+            db (pd.DataFrame): The new rows with at least the facet columns, indexed by row ids not in the index.
+        """
+        added = FacetIndex.from_frame(db)
+        for column, values in added.bitsets.items():
+            column_bits = self.bitsets[column]
+            for value, bits in values.items():
+                column_bits[value] = column_bits.get(value, 0) | bits
+        self.live |= added.live
+
+    def remove(self, ids):
+        """
+        Remove rows from the index, dropping values that no row carries anymore.
+
+        Args:
+            ids (array-like): The row ids.
+        """
+        mask = ids_to_bits(ids)
+        if not mask:
+            return
+        for values in self.bitsets.values():
+            for value, bits in list(values.items()):
+                if bits & mask:
+                    bits &= ~mask
+                    if bits:
+                        values[value] = bits
+                    else:
+                        del values[value]
+        self.live &= ~mask
+
+    def values(self, column, where=None):
+        """
+        Get the values of a facet column that occur in the given rows.
+
+        Args:
+            column (str): The facet column.
+            where (int): Bitset restricting the rows to consider, or None for all rows.
+
+        Returns:
+            list: The reachable values in order of first appearance within the given rows.
+        """
+        if where is None:
+            where = self.live
+        reachable = []
+        for value, bits in self.bitsets[column].items():
+            bits &= where
+            if not bits:
+                continue
+            if self.order is None:
+                # The lowest set bit is the first row carrying the value
+                reachable.append(((bits & -bits).bit_length(), value))
+                continue
+            odd = bits & self.displaced
+            # The lowest row id that is not displaced is the first of those rows in the bank
+            regular = bits ^ odd if odd else bits
+            first = int(self.order[(regular & -regular).bit_length() - 1]) if regular else len(self.order)
+            if odd:
+                ids = bits_to_ids(odd >> self._displaced_low) + self._displaced_low
+                first = min(first, int(self.order[ids].min()))
+            reachable.append((first, value))
+        return [value for _, value in sorted(reachable)]
+
+    def match(self, column, selected):
+        """
+        Get the bitset of rows whose value in a facet column is one of the selected values.
+
+        Args:
+            column (str): The facet column.
+            selected (list): The selected values.
+
+        Returns:
+            int: The bitset of matching rows.
+        """
+        column_bits = self.bitsets[column]
+        bits = 0
+        for value in selected:
+            bits |= column_bits.get(value, 0)
+        return bits
+
+    def select_bits(self, domains, stakeholders, metrics, questiontype, skip_empty=False):
+        """
+        Get the bitset of rows matching every facet selection.
+
+        Args:
+            domains (list): The selected domains.
+            stakeholders (list): The selected stakeholders.
+            metrics (list): The selected metrics.
+            questiontype (list): The selected question types.
+            skip_empty (bool): Whether an empty selection leaves its facet unrestricted instead of matching nothing.
+
+        Returns:
+            int: The bitset of matching rows.
+        """
+        bits = self.live
+        for column, selected in zip(FACET_COLUMNS, (domains, stakeholders, metrics, questiontype)):
+            if not bits:
+                break
+            if skip_empty and not selected:
+                continue
+            bits &= self.match(column, selected)
+        return bits
+
+    def select(self, domains, stakeholders, metrics, questiontype):
+        """
+        Get the rows matching every facet selection.
+
+        Args:
+            domains (list): The selected domains.
+            stakeholders (list): The selected stakeholders.
+            metrics (list): The selected metrics.
+            questiontype (list): The selected question types.
+
+        Returns:
+            np.ndarray: The sorted matching row ids.
+        """
+        return bits_to_ids(self.select_bits(domains, stakeholders, metrics, questiontype))
@@ -0,0 +1,307 @@
+"""
+This module collects per-session timings and counters for the Question Generator.
+Stages are timed with spans, and the collected metrics can be rendered in the Prometheus text format,
+written to a textfile, served on a local HTTP endpoint and logged as structured JSON. It is configured
+from the environment:
+
+    QG_METRICS_PORT   serve /metrics on 127.0.0.1 at this port
+    QG_METRICS_FILE   rewrite this Prometheus textfile every 15 seconds
+    QG_METRICS_LOG    log one JSON record per span when set to 1
+
+Series labelled with a session are kept while the session is active. Once it has been idle for
+SESSION_TTL seconds, or more than MAX_SESSIONS newer sessions are active, its timings and counters are
+folded into the series labelled session="expired" and its gauges are dropped, so the registry and
+its rendering stay bounded however long the server runs.
+"""
+
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PREFIX = "question_generator"
+
+# Seconds a session may be idle before its series expire
+SESSION_TTL = 1800.0
+# Number of sessions whose series are kept
+MAX_SESSIONS = 256
+# Label value of the series that collect the totals of expired sessions
+EXPIRED_SESSION = "expired"
+# Seconds between two rewrites of the metrics textfile
+TEXTFILE_INTERVAL = 15.0
+
+logger = logging.getLogger("question_generator.metrics")
+
+
+def _labels(labels):
+    """
+    Render a label set in the Prometheus text format.
+
+    Args:
+        labels (tuple): Sorted (name, value) pairs.
+
+    Returns:
+        str: The rendered labels, or an empty string when there are none.
+    """
+    if not labels:
+        return ""
+    rendered = []
+    for name, value in labels:
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        rendered.append(f'{name}="{value}"')
+    return "{" + ",".join(rendered) + "}"
+
+
+class MetricsRegistry:
+    """
+    Thread-safe store of stage timings, counters and gauges, shared by all sessions of a process.
+    """
+
+    def __init__(self, log=False, session_ttl=SESSION_TTL, max_sessions=MAX_SESSIONS):
+        """
+        Args:
+            log (bool): Whether to log one JSON record per finished span.
+            session_ttl (float): Seconds a session may be idle before its series expire.
+            max_sessions (int): Number of sessions whose series are kept.
+        """
+        self.log = log
+        self.session_ttl = session_ttl
+        self.max_sessions = max_sessions
+        self._timings = {}
+        self._counters = {}
+        self._gauges = {}
+        # Session -> (last seen, keys of its series), least recently seen first
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _track(self, store, key, labels):
+        """
+        Note that a session recorded a series, and expire idle sessions. Called with the lock held.
+
+        Args:
+            store (dict): The store holding the series.
+            key: The key of the series in the store.
+            labels (dict): The labels of the series.
+        """
+        now = time.monotonic()
+        session = labels.get("session")
+        if session is not None and session != EXPIRED_SESSION:
+            _, keys = self._sessions.pop(session, (None, set()))
+            keys.add((id(store), key))
+            self._sessions[session] = (now, keys)
+        while self._sessions:
+            oldest, (seen, keys) = next(iter(self._sessions.items()))
+            if len(self._sessions) <= self.max_sessions and now - seen < self.session_ttl:
+                break
+            del self._sessions[oldest]
+            self._expire(keys)
+
+    def _expire(self, keys):
+        """
+        Fold the timings and counters of an expired session into the expired series and drop its
+        gauges. Called with the lock held.
+
+        Args:
+            keys (set): The (store id, key) pairs of the session's series.
+        """
+        for store_id, key in keys:
+            if store_id == id(self._timings) and key in self._timings:
+                count, total, peak = self._timings.pop(key)
+                merged = tuple((name, EXPIRED_SESSION if name == "session" else value) for name, value in key)
+                old_count, old_total, old_peak = self._timings.get(merged, (0, 0.0, 0.0))
+                self._timings[merged] = (old_count + count, old_total + total, max(old_peak, peak))
+            elif store_id == id(self._counters) and key in self._counters:
+                name, labels = key
+                merged = (name, tuple((label, EXPIRED_SESSION if label == "session" else value) for label, value in labels))
+                self._counters[merged] = self._counters.get(merged, 0) + self._counters.pop(key)
+            elif store_id == id(self._gauges):
+                self._gauges.pop(key, None)
+
+    def observe(self, stage, seconds, **labels):
+        """
+        Record the duration of one run of a stage.
+
+        Args:
+            stage (str): The stage name.
+            seconds (float): The duration.
+            **labels: Extra labels, such as the session id.
+        """
+        key = tuple(sorted({"stage": stage, **labels}.items()))
+        with self._lock:
+            count, total, peak = self._timings.get(key, (0, 0.0, 0.0))
+            self._timings[key] = (count + 1, total + seconds, max(peak, seconds))
+            self._track(self._timings, key, labels)
+
+    def inc(self, name, amount=1, **labels):
+        """
+        Increase a counter.
+
+        Args:
+            name (str): The counter name, without prefix.
+            amount (float): The increment.
+            **labels: The counter labels.
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+            self._track(self._counters, key, labels)
+
+    def set_gauge(self, name, value, **labels):
+        """
+        Set a gauge.
+
+        Args:
+            name (str): The gauge name, without prefix.
+            value (float): The value.
+            **labels: The gauge labels.
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._gauges[key] = value
+            self._track(self._gauges, key, labels)
+
+    @contextmanager
+    def span(self, stage, **labels):
+        """
+        Time the enclosed block as one run of a stage.
+
+        Args:
+            stage (str): The stage name.
+            **labels: Extra labels, such as the session id.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self.observe(stage, seconds, **labels)
+            if self.log:
+                logger.info(json.dumps({"event": "span", "stage": stage, "seconds": round(seconds, 6), **labels}))
+
+    def render(self):
+        """
+        Render every metric in the Prometheus text format.
+
+        Returns:
+            str: The exposition text.
+        """
+        with self._lock:
+            self._track(None, None, {})
+            timings = dict(self._timings)
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+
+        lines = [
+            f"# HELP {PREFIX}_stage_seconds Time spent in each stage of a rerun.",
+            f"# TYPE {PREFIX}_stage_seconds summary",
+        ]
+        for labels, (count, total, _) in sorted(timings.items()):
+            lines.append(f"{PREFIX}_stage_seconds_count{_labels(labels)} {count}")
+            lines.append(f"{PREFIX}_stage_seconds_sum{_labels(labels)} {total:.6f}")
+        lines.append(f"# TYPE {PREFIX}_stage_seconds_max gauge")
+        for labels, (_, _, peak) in sorted(timings.items()):
+            lines.append(f"{PREFIX}_stage_seconds_max{_labels(labels)} {peak:.6f}")
+        for kind, values in (("counter", counters), ("gauge", gauges)):
+            for name in sorted({name for name, _ in values}):
+                suffix = "_total" if kind == "counter" else ""
+                lines.append(f"# TYPE {PREFIX}_{name}{suffix} {kind}")
+                for (metric, labels), value in sorted(values.items()):
+                    if metric == name:
+                        lines.append(f"{PREFIX}_{name}{suffix}{_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path):
+        """
+        Write the metrics to a Prometheus textfile, replacing it atomically.
+
+        Args:
+            path (str): The textfile path.
+        """
+        # Every writer gets its own temporary file, even threads of one process
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=os.path.basename(path) + ".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(self.render())
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def write_textfile_periodically(self, path, interval=TEXTFILE_INTERVAL):
+        """
+        Rewrite a Prometheus textfile from a background thread.
+
+        Args:
+            path (str): The textfile path.
+            interval (float): Seconds between two rewrites.
+
+        Returns:
+            threading.Event: Set it to stop the writer.
+        """
+        stop = threading.Event()
+
+        def write():
+            while not stop.wait(interval):
+                try:
+                    self.write_textfile(path)
+                except OSError:
+                    logger.exception("Writing the metrics textfile failed")
+
+        threading.Thread(target=write, name="metrics-textfile", daemon=True).start()
+        return stop
+
+    def serve(self, port, host="127.0.0.1"):
+        """
+        Serve the metrics on /metrics from a background thread.
+
+        Args:
+            port (int): The port to listen on.
+            host (str): The address to bind, local only by default.
+
+        Returns:
+            ThreadingHTTPServer: The running server.
+        """
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+        return server
+
+
+def registry_from_env():
+    """
+    Create a registry configured from the QG_METRICS_* environment variables, starting the
+    HTTP endpoint if a port is set and the textfile writer if a file is set.
+
+    Returns:
+        MetricsRegistry: The registry.
+    """
+    registry = MetricsRegistry(log=os.environ.get("QG_METRICS_LOG") == "1")
+    port = os.environ.get("QG_METRICS_PORT")
+    if port:
+        registry.serve(int(port))
+    path = os.environ.get("QG_METRICS_FILE")
+    if path:
+        registry.write_textfile_periodically(path)
+    return registry
@@ -0,0 +1,275 @@
+"""
+This module keeps the question bank live while the app is running.
+A background thread polls the question banks and lookup_dicts.py for changes to their modification
+time, size or inode. On a change the catalog is recompiled, reading the descriptions from the edited
+lookup_dicts.py rather than the module imported at startup, the new bank is diffed against the loaded
+one row by row, and only the added, removed or changed rows are applied to copies of the indexes.
+Every version is published as a BankState that is never modified afterwards, so a session holding
+a state keeps a consistent view of the bank and its indexes while newer versions are published.
+The search and duplicate indexes of a state are built on the reload thread before it is published,
+so no session pays for them inside a rerun.
+"""
+
+import logging
+import threading
+
+import pandas as pd
+
+from dedup import DuplicateIndex
+from facet_index import FACET_COLUMNS, FacetIndex
+from question_engine import (
+    LOOKUP_DICTS_PATH,
+    MAIN_DB_PATH,
+    PERSONAL_DB_PATH,
+    catalog_version,
+    descriptions,
+    load_catalog,
+    option_sets,
+    row_hashes,
+)
+from search_index import SearchIndex, document_text
+
+SEARCH_COLUMNS = ["Question", "Answer Options"]
+
+logger = logging.getLogger("question_generator.reload")
+
+
+class BankState:
+    """
+    One version of the question bank with its indexes.
+
+    The facet index is built with the state. The search index, the duplicate index and the row hashes
+    used for diffing are built by build_indexes, or on first use if that has not run yet. Every lazy
+    field has its own lock, so reading one never waits for another to be built.
+    """
+
+    def __init__(self, catalog, facet_index, search_index=None, duplicate_index=None, hashes=None):
+        """
+        Args:
+            catalog (Catalog): The open catalog of this version.
+            facet_index (FacetIndex): The facet index over its bank.
+            search_index (SearchIndex): The search index over its bank, or None to build it when needed.
+            duplicate_index (DuplicateIndex): The duplicate index over its bank, or None to build it when needed.
+            hashes (pd.Series): The content hash of each row, or None to compute them when needed.
+        """
+        self.catalog = catalog
+        self.version = catalog.version
+        self.bank = catalog.tables["bank"]
+        self.facet_index = facet_index
+        self._search_index = search_index
+        self._duplicate_index = duplicate_index
+        self._hashes = hashes
+        self._descriptions = None
+        self._option_sets = None
+        self._locks = {name: threading.Lock() for name in ("_search_index", "_duplicate_index", "_hashes", "_descriptions", "_option_sets")}
+
+    def _lazy(self, name, build):
+        """
+        Get a lazy field, building it under its own lock on first use.
+
+        Args:
+            name (str): The attribute holding the field.
+            build (callable): Builds the field.
+
+        Returns:
+            The field.
+        """
+        value = getattr(self, name)
+        if value is not None:
+            return value
+        with self._locks[name]:
+            value = getattr(self, name)
+            if value is None:
+                value = build()
+                setattr(self, name, value)
+            return value
+
+    @classmethod
+    def from_catalog(cls, catalog):
+        """
+        Build the state of a catalog from scratch.
+
+        Args:
+            catalog (Catalog): The open catalog.
+
+        Returns:
+            BankState: The state.
+        """
+        bank = catalog.tables["bank"]
+        return cls(catalog, FacetIndex.from_frame(bank.frame(columns=FACET_COLUMNS)))
+
+    @property
+    def search_index(self):
+        """SearchIndex: The full-text search index over the bank."""
+        return self._lazy("_search_index", lambda: SearchIndex.from_frame(self.bank.frame(columns=SEARCH_COLUMNS)))
+
+    @property
+    def duplicate_index(self):
+        """DuplicateIndex: The near-duplicate index over the bank."""
+        return self._lazy("_duplicate_index", lambda: DuplicateIndex.from_frame(self.bank.frame(columns=["Question"])))
+
+    @property
+    def descriptions(self):
+        """dict: The descriptions of the domains, stakeholders, metrics and question types."""
+        return self._lazy("_descriptions", lambda: descriptions(self.catalog))
+
+    @property
+    def option_sets(self):
+        """list: The options of every answer option set, by the code of Answer Options in the bank."""
+        return self._lazy("_option_sets", lambda: option_sets(self.catalog))
+
+    def row_hashes(self):
+        """
+        Get the content hash of every row of the bank.
+
+        Returns:
+            pd.Series: The hashes, indexed by row id.
+        """
+        return self._lazy("_hashes", lambda: row_hashes(self.bank.frame()))
+
+    def build_indexes(self):
+        """
+        Build the search and duplicate indexes and the row hashes, if they are not built yet.
+
+        Returns:
+            BankState: This state.
+        """
+        self.row_hashes()
+        self.search_index
+        self.duplicate_index
+        return self
+
+    def update(self, catalog):
+        """
+        Build the state of a newer catalog by applying the rows that changed to copies of the indexes.
+        Indexes that were never built in this state are left to be built by build_indexes or when needed.
+
+        Args:
+            catalog (Catalog): The open catalog of the newer version.
+
+        Returns:
+            BankState: The newer state.
+        """
+        bank = catalog.tables["bank"]
+        if bank.columns != self.bank.columns:
+            return BankState.from_catalog(catalog)
+        new_rows = bank.frame()
+        new_hashes = row_hashes(new_rows)
+        old_hashes = self.row_hashes()
+
+        # Rows keep their id when their content is unchanged, an edited row gets a new id
+        common = old_hashes.index.intersection(new_hashes.index)
+        unchanged = common[old_hashes[common].to_numpy() == new_hashes[common].to_numpy()]
+        removed = old_hashes.index.difference(unchanged).to_numpy()
+        added = new_hashes.index.difference(unchanged).to_numpy()
+        added_rows = new_rows.loc[added]
+
+        facet_index = self.facet_index.copy()
+        facet_index.remove(removed)
+        facet_index.add(added_rows)
+        # Edited rows get new ids, so the values are ordered by their position in the new bank
+        facet_index.set_bank_order(bank.index)
+
+        search_index = self._search_index
+        if search_index is not None:
+            search_index = search_index.copy()
+            search_index.remove(removed, document_text(self.bank.frame(removed, columns=SEARCH_COLUMNS)).tolist())
+            search_index.add(added, document_text(added_rows).tolist())
+
+        duplicate_index = self._duplicate_index
+        if duplicate_index is not None:
+            duplicate_index = duplicate_index.copy()
+            duplicate_index.remove(removed)
+            duplicate_index.add(added, added_rows["Question"].tolist())
+
+        logger.info("Reloaded question bank %s: %d rows added, %d removed", catalog.version, len(added), len(removed))
+        return BankState(catalog, facet_index, search_index, duplicate_index, new_hashes)
+
+
+class LiveBank:
+    """
+    The latest BankState of a question bank, refreshed when its sources change.
+    """
+
+    def __init__(self, path=MAIN_DB_PATH, personal_path=PERSONAL_DB_PATH, interval=5.0, lookup_path=LOOKUP_DICTS_PATH):
+        """
+        Args:
+            path (str): Path to the main question bank CSV.
+            personal_path (str): Path to the personal questions CSV.
+            interval (float): Seconds between two polls of the sources.
+            lookup_path (str): Path to lookup_dicts.py, the source of the descriptions.
+        """
+        self.path = path
+        self.personal_path = personal_path
+        self.lookup_path = lookup_path
+        self.interval = interval
+        self.state = BankState.from_catalog(load_catalog(path, personal_path, lookup_path))
+        self.reloads = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def current(self):
+        """
+        Get the latest state. Callers should keep the returned state for as long as they need a
+        consistent view, instead of calling this again.
+
+        Returns:
+            BankState: The latest state.
+        """
+        return self.state
+
+    def refresh(self):
+        """
+        Check the sources and publish a new state if they changed.
+
+        Returns:
+            bool: Whether a new state was published.
+        """
+        with self._lock:
+            try:
+                if catalog_version(self.path, self.personal_path, self.lookup_path) == self.state.version:
+                    return False
+                catalog = load_catalog(self.path, self.personal_path, self.lookup_path)
+                # A source that changed while it was compiled may have been read half written
+                if catalog.version != catalog_version(self.path, self.personal_path, self.lookup_path):
+                    return False
+            # A half-edited lookup_dicts.py may not even parse
+            except (OSError, ValueError, KeyError, SyntaxError, pd.errors.ParserError) as e:
+                logger.warning("Keeping question bank %s, reload failed: %s", self.state.version, e)
+                return False
+            # Indexes are completed before publishing, so sessions never build them in a rerun
+            self.state = self.state.update(catalog).build_indexes()
+            self.reloads += 1
+            return True
+
+    def start(self):
+        """
+        Start polling the sources from a background thread, which first builds the indexes of the
+        loaded state.
+        """
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._poll, name="bank-reload", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop polling the sources.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _poll(self):
+        """Build the indexes of the loaded state, then refresh the state every interval until stopped."""
+        try:
+            self.state.build_indexes()
+        except Exception:
+            logger.exception("Building the question bank indexes failed")
+        while not self._stop.wait(self.interval):
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception("Reloading the question bank failed")
@@ -1,68 +1,163 @@
 """
 This module is used to build a Question Generator using Streamlit.
-It generates questions based on selected parameters and allows the user to download the data in CSV or JSON format.
+It generates questions based on selected parameters and allows the user to download the data in CSV, JSON or Parquet format.
 Author: Saahil Mehta (saahil.mehta8520@gmail.com)
 """
 
+import time
+import uuid
+
 import pandas as pd
 import streamlit as st
-from lookup_dicts import domain_descriptions,stakeholder_descriptions, metrics_descriptions, question_type_descriptions
-
-if 'clicked' not in st.session_state:
-    st.session_state.clicked = False
+import question_engine
+from edits import PatchLog
+from live_bank import LiveBank
+from dedup import mark_duplicates
+from result_cache import SelectionCache, selection_key
+from export import FORMATS, ExportReader
+from instrumentation import registry_from_env
+
+EXPORT_LABELS = {
+    "csv": "CSV",
+    "csv.gz": "CSV (gzip)",
+    "json": "JSON",
+    "ndjson": "NDJSON",
+    "ndjson.gz": "NDJSON (gzip)",
+    "parquet": "Parquet",
+}
+
+# Seconds between two checks of the question banks for changes
+RELOAD_INTERVAL = 5.0
+
+# Maximum number of questions returned by a text search
+SEARCH_LIMIT = 100
+
+# Ways to handle near-duplicate questions in the generated set
+DUPLICATE_MODES = {
+    "keep": "Keep all",
+    "flag": "Flag",
+    "collapse": "Collapse",
+}
+
+# Columns of the generated questions that can be modified before downloading
+EDITABLE_FIELDS = {
+    "questions": "Question",
+    "options": "Answer options",
+}
 
 def click_button():
     """Function to handle click event of the 'Generate Questions' button."""
     st.session_state.clicked = True
+    st.session_state.bank_state = get_live_bank().current()
 
-@st.cache_data
-def convert_df(df):
+@st.cache_resource
+def get_metrics_registry():
     """
-    Converts a DataFrame to CSV and encodes it in utf-8 format.
-    
+    Get the metrics registry shared by all sessions, configured from the QG_METRICS_* environment variables.
+
+    Returns:
+        MetricsRegistry: The shared registry.
+    """
+    return registry_from_env()
+
+def span(stage):
+    """
+    Time a stage of the current rerun for this session.
+
     Args:
-        df (pd.DataFrame): The DataFrame to convert.
-        
+        stage (str): The stage name.
+
     Returns:
-        The encoded CSV data.
+        The span context manager.
     """
-    # IMPORTANT: Cache the conversion to prevent computation on every rerun
-    return df.to_csv().encode('utf-8')
+    return get_metrics_registry().span(stage, session=st.session_state.session_id)
 
-@st.cache_data
-def convert_df_to_json(df):
+def export_payload(df, fmt, session_id):
     """
-    Converts a DataFrame to JSON and encodes it in utf-8 format.
-    
+    Open a stream encoding a DataFrame for download, recording the time taken and the payload size
+    once the stream has been read to the end.
+
     Args:
-        df (pd.DataFrame): The DataFrame to convert.
-        
+        df (pd.DataFrame or callable): The DataFrame to download, or a callable returning it.
+        fmt (str): The export format, one of export.FORMATS.
+        session_id (str): The session requesting the download.
+
+    Returns:
+        ExportReader: The file object yielding the encoded payload chunk by chunk.
+    """
+    registry = get_metrics_registry()
+    start = time.perf_counter()
+
+    def finished(size):
+        registry.observe("export", time.perf_counter() - start, session=session_id, format=fmt)
+        registry.inc("payload_bytes", size, session=session_id, format=fmt)
+
+    return ExportReader(df() if callable(df) else df, fmt, on_finish=finished)
+
+def export_button(label, df, fmt, file_stem):
+    """
+    Create a download button that only encodes the DataFrame when the download is requested.
+
+    Args:
+        label (str): The button label.
+        df (pd.DataFrame or callable): The DataFrame to download, or a callable returning it.
+        fmt (str): The export format, one of export.FORMATS.
+        file_stem (str): The file name without extension.
+    """
+    extension, mime = FORMATS[fmt]
+    # The callable runs outside the script thread, so the session id is captured here
+    session_id = st.session_state.session_id
+    st.download_button(
+        label=label,
+        data=lambda: export_payload(df, fmt, session_id),
+        file_name=f"{file_stem}.{extension}",
+        mime=mime,
+        on_click="ignore",
+        )
+
+@st.cache_resource
+def get_live_bank():
+    """
+    Get the live question bank shared by all sessions, which reloads itself in the background
+    when mainDB.csv, personalDB.csv or lookup_dicts.py change, descriptions included.
+
     Returns:
-        The encoded JSON data.
+        LiveBank: The live question bank.
     """
-    # IMPORTANT: Cache the conversion to prevent computation on every rerun
-    return df.to_json().encode('utf-8')
+    live_bank = LiveBank(interval=RELOAD_INTERVAL)
+    live_bank.start()
+    return live_bank
 
-@st.cache_data
 def load_data():
     """
-    Load data from a CSV file and strips white spaces from all columns.
-    
+    Get the question bank version of this session. A session keeps its version while generated
+    questions are shown, so edits and downloads stay consistent with them, and moves to the
+    latest version on the next click of 'Generate Questions'.
+
     Returns:
-        pd.DataFrame: The loaded data.
+        BankState: The question bank with its indexes.
+    """
+    if "bank_state" not in st.session_state or not st.session_state.clicked:
+        st.session_state.bank_state = get_live_bank().current()
+    return st.session_state.bank_state
+
+@st.cache_resource
+def get_result_cache():
     """
-    db = pd.read_csv("mainDB.csv")
-    # Strip whitespaces from all columns
-    db = db.applymap(lambda x: x.strip() if isinstance(x, str) else x)
-    return db
+    Get the generated question cache shared by all sessions.
+
+    Returns:
+        SelectionCache: The shared cache.
+    """
+    return SelectionCache()
 
-@st.cache_data
 def generate_questions(data, timeline, stakeholders, metrics, domains, questiontype):
     """
     Generates questions by filtering data based on selected parameters.
+    Results are cached on the selection, so the DataFrame must not be modified in place.
     
     Args:
-        data (pd.DataFrame): The DataFrame containing all questions.
+        data (BankState): The question bank.
         timeline (int): The selected timeline.
         stakeholders (list): The selected stakeholders.
         metrics (list): The selected metrics.
@@ -72,38 +167,79 @@ def generate_questions(data, timeline, stakeholders, metrics, domains, questiont
     Returns:
         pd.DataFrame: The DataFrame containing generated questions.
     """
-    questions_df = data
-
-    # Filter the questions based on the selected parameters
-    filtered_questions_df = questions_df[(questions_df['Domain'].isin(domains)) &
-                                         (questions_df['Stakeholder'].isin(stakeholders))&
-                                         (questions_df['Metric Area'].isin(metrics)) &
-                                         (questions_df['Question Type'].isin(questiontype))
-                                         ]
-
-    # Get the list of filtered questions
-    # questions = filtered_questions_df['Question'].tolist()
-
-    data_df = pd.DataFrame({
-        "row_number" : range(0, len(filtered_questions_df)),
-        "questions": filtered_questions_df['Question'],
-        "relevant?": [False] * len(filtered_questions_df),
-        "domain": filtered_questions_df['Domain'],
-        "timeline (in months)": [timeline] * len(filtered_questions_df),
-        "stakeholders": filtered_questions_df['Stakeholder'],
-        "metrics": filtered_questions_df['Metric Area'],
-        "options" : filtered_questions_df["Answer Options"]
-    })
-    
+    key = selection_key(data.version, timeline, stakeholders, metrics, domains, questiontype)
+    return get_result_cache().get_or_compute(
+        key,
+        lambda: question_engine.generate_questions(data.bank, timeline, stakeholders, metrics, domains, questiontype, index=data.facet_index),
+    )
 
-    return data_df
+def build_questionnaire(data, timeline, stakeholders, metrics, domains, questiontype, budget, quotas, distinct):
+    """
+    Picks at most budget questions covering the selected parameters as evenly as possible.
+    Results are cached on the selection and budget, so the DataFrame must not be modified in place.
 
-def generate_personal_questions():
+    Args:
+        data (BankState): The question bank.
+        timeline (int): The selected timeline.
+        stakeholders (list): The selected stakeholders.
+        metrics (list): The selected metrics.
+        domains (list): The selected domains.
+        questiontype (list): The selected question types.
+        budget (int): The maximum number of questions.
+        quotas (dict): Maps "Metric Area" or "Question Type" to dicts of value -> maximum number of questions.
+        distinct (bool): Whether to pick at most one question of each group of near-duplicates.
 
-    file_path = 'personalDB.csv'
-    personal_questions_df = pd.read_csv(file_path)
+    Returns:
+        pd.DataFrame: The picked questions.
+    """
+    quota_key = tuple(sorted((column, tuple(sorted(limits.items()))) for column, limits in quotas.items()))
+    key = selection_key(data.version, timeline, stakeholders, metrics, domains, questiontype) + ("budget", budget, quota_key, distinct)
+    return get_result_cache().get_or_compute(
+        key,
+        lambda: question_engine.build_questionnaire(
+            data.bank, timeline, stakeholders, metrics, domains, questiontype, budget, quotas,
+            index=data.facet_index, duplicate_index=data.duplicate_index if distinct else None,
+        ),
+    )
+
+def search_questions(data, query, timeline, stakeholders, metrics, domains, questiontype):
+    """
+    Searches the question text and answer options, restricted to the selected parameters.
+    Results are cached on the query and selection, so the DataFrame must not be modified in place.
 
-    return personal_questions_df
+    Args:
+        data (BankState): The question bank.
+        query (str): The search text.
+        timeline (int): The selected timeline.
+        stakeholders (list): The selected stakeholders.
+        metrics (list): The selected metrics.
+        domains (list): The selected domains.
+        questiontype (list): The selected question types.
+
+    Returns:
+        pd.DataFrame: The matching questions, best match first.
+    """
+    query = " ".join(query.split())
+    key = selection_key(data.version, timeline, stakeholders, metrics, domains, questiontype) + ("search", query.lower())
+    return get_result_cache().get_or_compute(
+        key,
+        lambda: question_engine.search_questions(
+            data.bank, query, timeline, stakeholders, metrics, domains, questiontype,
+            search_index=data.search_index, index=data.facet_index, limit=SEARCH_LIMIT,
+        ),
+    )
+
+def generate_personal_questions(db):
+    """
+    Load the personal questions.
+
+    Args:
+        db (BankState): The question bank.
+
+    Returns:
+        pd.DataFrame: The personal questions.
+    """
+    return question_engine.generate_personal_questions(catalog=db.catalog)
 
 
 def get_domain(db):
@@ -111,16 +247,15 @@ def get_domain(db):
     Get the unique domain values from the database and create a multiselect widget for domain selection.
     
     Args:
-        db (pd.DataFrame): The DataFrame containing all data.
+        db (BankState): The question bank.
         
     Returns:
         list: The list of selected domains.
     """
-    domainValues = db["Domain"].str.strip()
-    domains = domainValues.unique()
+    domains = db.facet_index.values("Domain")
     domain = st.multiselect("Domains", domains, placeholder="Click for options, select max 3.",max_selections=3)
     for dom in domain:
-        st.caption("_"+dom+": "+domain_descriptions[dom]+"_")  # Display the description for the selected domain
+        st.caption("_"+dom+": "+db.descriptions["domain_descriptions"].get(dom, "")+"_")  # Display the description for the selected domain
     return domain
 
 def get_timeline(db):
@@ -128,7 +263,7 @@ def get_timeline(db):
     Create a slider widget for timeline selection.
     
     Args:
-        db (pd.DataFrame): The DataFrame containing all data.
+        db (BankState): The question bank.
         
     Returns:
         int: The selected timeline.
@@ -141,7 +276,7 @@ def get_stakeholders(db, domains):
     Get the unique stakeholder values based on selected domains and create a multiselect widget for stakeholder selection.
     
     Args:
-        db (pd.DataFrame): The DataFrame containing all data.
+        db (BankState): The question bank.
         domains (list): The list of selected domains.
         
     Returns:
@@ -151,13 +286,11 @@ def get_stakeholders(db, domains):
     #    stakeValues = db.loc[db['Domain'].isin(domains), 'Stakeholder'].str.strip()
     #else:
     #    stakeValues = db['Stakeholder'].str.strip()
-    stakeValues = db['Stakeholder'].str.strip()
-        
-    stakeholders = stakeValues.unique()
+    stakeholders = db.facet_index.values("Stakeholder")
     #selected_stakeholders = st.multiselect("Stakeholder selection", stakeholders, placeholder="Click for options. Please note this is based on 'Domain' selection.")
     selected_stakeholders = st.multiselect("Stakeholder selection", stakeholders, placeholder="Click for options.")
     for stakeholder in selected_stakeholders:
-        st.caption("_"+stakeholder+": "+stakeholder_descriptions[stakeholder]+"_")  # Display the description for the selected stakeholders
+        st.caption("_"+stakeholder+": "+db.descriptions["stakeholder_descriptions"].get(stakeholder, "")+"_")  # Display the description for the selected stakeholders
     return selected_stakeholders
     
 def get_metrics(db,stakeholders):
@@ -165,21 +298,20 @@ def get_metrics(db,stakeholders):
     Get the unique metric values based on selected stakeholders and create a multiselect widget for metric selection.
     
     Args:
-        db (pd.DataFrame): The DataFrame containing all data.
+        db (BankState): The question bank.
         stakeholders (list): The list of selected stakeholders.
         
     Returns:
         list: The list of selected metrics.
     """
+    index = db.facet_index
     if stakeholders:
-        metricValues = db.loc[db['Stakeholder'].isin(stakeholders), 'Metric Area'].str.strip()
+        metrics = index.values("Metric Area", where=index.match("Stakeholder", stakeholders))
     else:
-        metricValues = db['Metric Area'].str.strip()
-
-    metrics = metricValues.unique()
+        metrics = index.values("Metric Area")
     selected_metrics = st.multiselect("Likely Metrics to Measure", metrics, placeholder="Click for options.Please note this is based on 'Stakeholder' selection.")
     for metric in selected_metrics:
-        st.caption("_"+metric+": "+metrics_descriptions[metric]+"_")
+        st.caption("_"+metric+": "+db.descriptions["metrics_descriptions"].get(metric, "")+"_")
     return selected_metrics
 
 def get_types(db,metrics):
@@ -187,36 +319,46 @@ def get_types(db,metrics):
     Get the unique question type values based on selected metrics and create a multiselect widget for question type selection.
     
     Args:
-        db (pd.DataFrame): The DataFrame containing all data.
+        db (BankState): The question bank.
         metrics (list): The list of selected metrics.
         
     Returns:
         list: The list of selected question types.
     """
+    index = db.facet_index
     if metrics:
-        qt = db.loc[db['Metric Area'].isin(metrics), 'Question Type'].str.strip()
+        qtValues = index.values("Question Type", where=index.match("Metric Area", metrics))
     else:
-        qt = db['Question Type'].str.strip()
-
-    qtValues = qt.unique()
+        qtValues = index.values("Question Type")
     selected_types = st.multiselect("Types of Questions Needed (NOTE: by default, ALL types are selected)", qtValues, placeholder="Click for options.", default = qtValues)
     for ques in selected_types:
-        st.caption("_"+ques+": "+question_type_descriptions[ques]+"_")
+        st.caption("_"+ques+": "+db.descriptions["question_type_descriptions"].get(ques, "")+"_")
     return selected_types
 
 def main():
     """
     The main function to run the application.
     """
-    st.image("Fathom-logo_With-text-1200x500px.png", use_container_width=True)
+    rerun_start = time.perf_counter()
+    if 'clicked' not in st.session_state:
+        st.session_state.clicked = False
+    if 'session_id' not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex[:12]
+
+    with span("logo"):
+        st.image("Fathom-logo_With-text-1200x500px.png", use_container_width=True)
     "---"
     st.markdown("<h1 style='text-align: center;'>Question Generator</h1>", unsafe_allow_html=True)
 
-    db = load_data()
+    with span("load_data"):
+        db = load_data()
+    if db is not get_live_bank().current():
+        st.info("The question bank has been updated. Click 'Generate Questions' to use the latest questions.")
     "---"
     st.header("Domain Selector")
     st.caption("Select the domain (or the closest possible option(s)) you want to generate questions for.")
-    domain = get_domain(db)
+    with span("domain_widget"):
+        domain = get_domain(db)
     
     # if st.button('Confirm Domain Selection'):
     #     st.session_state.domain = domain
@@ -237,54 +379,92 @@ def main():
     
     st.header("Stakeholders")
     st.caption("Select the stakeholders you want to generate questions for, from the options below.")
-    stakeholders = get_stakeholders(db, domains=domain)
+    with span("stakeholder_widget"):
+        stakeholders = get_stakeholders(db, domains=domain)
 
     st.header("Metrics")
     st.caption("Select the metric you want to measure and generate questions for.")
-    metrics = get_metrics(db, stakeholders=stakeholders)
+    with span("metric_widget"):
+        metrics = get_metrics(db, stakeholders=stakeholders)
 
     st.header("Question Types")
     st.caption("Select the desired types of questions you want to generate.")
-    questions = get_types(db, metrics=metrics)
-
+    with span("type_widget"):
+        questions = get_types(db, metrics=metrics)
+
+
+    st.header("Search")
+    st.caption("Optionally type keywords to find matching questions, ranked by relevance. Selections above narrow the search; empty selections do not.")
+    query = st.text_input("Search questions", placeholder="e.g. funding impact community")
+    duplicate_mode = st.radio("Near-duplicate questions", list(DUPLICATE_MODES), format_func=DUPLICATE_MODES.get, horizontal=True)
+
+    st.header("Questionnaire Size")
+    st.caption("Optionally limit the number of questions. The questions are then picked to cover the selected stakeholders, metrics and question types as evenly as possible.")
+    budget = st.number_input("Maximum number of questions (0 for all matching questions)", min_value=0, value=0, step=1)
+    quotas = {}
+    if budget:
+        col1, col2 = st.columns(2)
+        metric_quota = col1.number_input("Maximum per metric (0 for no limit)", min_value=0, value=0, step=1)
+        type_quota = col2.number_input("Maximum per question type (0 for no limit)", min_value=0, value=0, step=1)
+        if metric_quota:
+            quotas["Metric Area"] = {metric: metric_quota for metric in metrics}
+        if type_quota:
+            quotas["Question Type"] = {question_type: type_quota for question_type in questions}
 
     st.button("Generate Questions",on_click=click_button)
     if st.session_state.clicked:
         # questions = generate_questions(data=db)
-        data_df = generate_questions(data=db,timeline=timeline,domains=domain,stakeholders=stakeholders,metrics=metrics, questiontype=questions)
-
-        final = st.data_editor(
-            data_df,
-            column_config={
-            "relevant": st.column_config.CheckboxColumn(
-            "Relevant?",
-            default=False,
-                )
-            },
-            # disabled=["widgets"],
-            # hide_index=True,
-        )
+        with span("generate_questions"):
+            if query.strip():
+                data_df = search_questions(db, query, timeline, stakeholders, metrics, domain, questions)
+            elif budget:
+                data_df = build_questionnaire(db, timeline, stakeholders, metrics, domain, questions, budget, quotas, distinct=duplicate_mode == "collapse")
+            else:
+                data_df = generate_questions(data=db,timeline=timeline,domains=domain,stakeholders=stakeholders,metrics=metrics, questiontype=questions)
+        if duplicate_mode != "keep":
+            with span("dedup"):
+                data_df = mark_duplicates(data_df, db.duplicate_index, mode=duplicate_mode)
+        get_metrics_registry().set_gauge("result_rows", len(data_df), session=st.session_state.session_id)
+
+        with span("data_editor"):
+            final = st.data_editor(
+                data_df,
+                column_config={
+                "relevant": st.column_config.CheckboxColumn(
+                "Relevant?",
+                default=False,
+                    ),
+                # Answer options are picked from the option sets of the bank instead of typed
+                "options": st.column_config.SelectboxColumn(
+                "Answer options",
+                options=db.bank.categories(question_engine.OPTIONS_COLUMN),
+                    ),
+                },
+                # disabled=["widgets"],
+                # hide_index=True,
+            )
+
+        fmt = st.selectbox("Download format", list(EXPORT_LABELS), format_func=EXPORT_LABELS.get)
 
         include_personal_questions = st.checkbox('Would you like to download personal questions?')
         if include_personal_questions:
             # Assume that personal_questions_df is the DataFrame containing the personal questions.
-            personal_questions_df = generate_personal_questions()  # Define this function to load personal questions
+            with span("personal_questions"):
+                personal_questions_df = generate_personal_questions(db)  # Define this function to load personal questions
             st.write("Here are the included personal questions:")
             st.dataframe(personal_questions_df)
             
-            personal_csv = convert_df(personal_questions_df)
-            
-            st.download_button(
-                label="Download personal questions as CSV",
-                data=personal_csv,
-                file_name='personalQuestions.csv',
-                mime='text/csv',
-            )
+            export_button("Download personal questions as "+EXPORT_LABELS[fmt], personal_questions_df, fmt, 'personalQuestions')
 
-        temp_data_df = data_df.copy()
+        # Edits are kept as a patch log per selection and only applied when viewed or downloaded
+        selection = selection_key(db.version, timeline, stakeholders, metrics, domain, questions) + (query.strip().lower(), duplicate_mode, budget, str(quotas))
+        if st.session_state.get("patch_selection") != selection:
+            st.session_state.patch_selection = selection
+            st.session_state.patch_log = PatchLog()
+        patch_log = st.session_state.patch_log
 
             # Ask if the user wants to modify the data
-        if st.checkbox('Would you like to modify the data before downloading?'):
+        if st.checkbox('Would you like to modify the data before downloading?') and len(data_df):
             # Default row to modify is the first one (0)
             default_row_number = 0
 
@@ -293,47 +473,55 @@ def main():
 
             # Show the selected row
             st.write("You selected row:", row_number)
-            st.table(temp_data_df.iloc[[row_number]])
-
-            # Create a text area for the question column in the selected row
-            user_input = st.text_area(f"Question:", temp_data_df.iloc[row_number]['questions'])
-            
-            # Update the temporary DataFrame with the user input
-            temp_data_df.iloc[row_number, temp_data_df.columns.get_loc('questions')] = user_input
-
-
-        csv = convert_df(final)
-        json = convert_df_to_json(final)
-        modified_csv = convert_df(temp_data_df)
-        
-        col1, col2, col3 = st.columns(3, gap="large")
+            st.table(patch_log.view(data_df, [row_number]))
+
+            # Create a text area for each editable column in the selected row
+            originals = {field: data_df.iloc[row_number][field] for field in EDITABLE_FIELDS}
+            with st.form(f"edit_row_{row_number}"):
+                values = {
+                    field: st.text_area(f"{label}:", patch_log.get(row_number, field, "" if pd.isna(originals[field]) else originals[field]))
+                    for field, label in EDITABLE_FIELDS.items()
+                }
+                if st.form_submit_button("Save changes to this row"):
+                    # Untouched empty fields keep their original missing value
+                    values = {field: originals[field] if value == "" and pd.isna(originals[field]) else value for field, value in values.items()}
+                    patch_log.update(row_number, values, originals)
+                    st.rerun()
+
+            st.caption(f"{len(patch_log)} modified row(s).")
+            if len(patch_log) and st.button("Discard all modifications"):
+                patch_log.clear()
+                st.rerun()
+
+        # Payloads are only encoded when a download button is clicked, not on every rerun
+        col1, col2 = st.columns(2, gap="large")
     
         with col1:
-            st.download_button(
-                label="Download data as CSV",
-                data=csv,
-                file_name='finalQuestions.csv',
-                mime='text/csv',
-                )
+            export_button("Download data as "+EXPORT_LABELS[fmt], final, fmt, 'finalQuestions')
         with col2:
-            st.download_button(
-                label="Download modified data as CSV (only if modified)",
-                data=modified_csv,
-                file_name='finalQuestionsModified.csv',
-                mime='text/csv',
-                )
-        with col3:
-            st.download_button(
-                label="Download data as JSON",
-                data=json,
-                file_name='finalQuestions.json',
-                mime='application/json',
-                )
+            export_button("Download modified data as "+EXPORT_LABELS[fmt]+" (only if modified)", lambda: patch_log.apply(data_df), fmt, 'finalQuestionsModified')
+
+    "---"
+    #"==="
+    st.text("Built by Saahil, Fathom Performance 2023 using Streamlit version: "+st.__version__)
+
+    record_rerun(time.perf_counter() - rerun_start)
+
+def record_rerun(seconds):
+    """
+    Record the duration of a whole rerun and the shared cache counters. The metrics textfile,
+    if QG_METRICS_FILE is set, is rewritten by the registry's own writer thread.
+
+    Args:
+        seconds (float): The duration of the rerun.
+    """
+    registry = get_metrics_registry()
+    registry.observe("rerun", seconds, session=st.session_state.session_id)
+    for name, value in get_result_cache().stats().items():
+        registry.set_gauge(f"result_cache_{name}", value)
+    registry.set_gauge("bank_reloads", get_live_bank().reloads)
 
 if __name__ == "__main__":
     
     main()
 
-"---"
-#"==="
-st.text("Built by Saahil, Fathom Performance 2023 using Streamlit version: "+st.__version__)
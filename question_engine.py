@@ -0,0 +1,475 @@
+"""
+This module holds the headless question engine behind the Question Generator.
+It compiles the question banks into a memory-mapped catalog, filters questions on the selected parameters
+and converts the results to CSV or JSON, without importing Streamlit, so it can be used from scripts and workers.
+Author: Saahil Mehta (saahil.mehta8520@gmail.com)
+"""
+
+import hashlib
+import os
+import runpy
+import tempfile
+
+import numpy as np
+import pandas as pd
+import lookup_dicts
+from answer_options import explode_personal, option_table
+from catalog import Catalog, CatalogTable, write_catalog
+from facet_index import FACET_COLUMNS, FacetIndex, bits_to_ids
+from questionnaire_builder import COVERAGE_COLUMNS, select_covering
+
+MAIN_DB_PATH = "mainDB.csv"
+PERSONAL_DB_PATH = "personalDB.csv"
+# The descriptions are read from this file whenever a catalog is compiled
+LOOKUP_DICTS_PATH = lookup_dicts.__file__
+CATALOG_SUFFIX = ".catalog"
+PERSONAL_COLUMNS = ("Type", "SubType", "Question")
+OPTIONS_COLUMN = "Answer Options"
+DESCRIPTION_KINDS = ("domain_descriptions", "stakeholder_descriptions", "metrics_descriptions", "question_type_descriptions")
+
+
+def convert_df(df):
+    """
+    Converts a DataFrame to CSV and encodes it in utf-8 format.
+
+    Args:
+        df (pd.DataFrame): The DataFrame to convert.
+
+    Returns:
+        The encoded CSV data.
+    """
+    return df.to_csv().encode('utf-8')
+
+
+def convert_df_to_json(df):
+    """
+    Converts a DataFrame to JSON and encodes it in utf-8 format.
+
+    Args:
+        df (pd.DataFrame): The DataFrame to convert.
+
+    Returns:
+        The encoded JSON data.
+    """
+    return df.to_json().encode('utf-8')
+
+
+def read_bank(path=MAIN_DB_PATH):
+    """
+    Read the main question bank CSV, strip white spaces from all columns and store the facet
+    columns and the Answer Options as categoricals. The codes of Answer Options are the ids of
+    the option sets in the catalog.
+
+    Args:
+        path (str): Path to the main question bank CSV.
+
+    Returns:
+        pd.DataFrame: The normalized question bank.
+    """
+    db = pd.read_csv(path, dtype=str)
+    for column in db.columns:
+        values = db[column].str.strip()
+        if column in FACET_COLUMNS or column == OPTIONS_COLUMN:
+            # Categories keep the order of first appearance, like Series.unique()
+            codes, categories = pd.factorize(values)
+            values = pd.Series(pd.Categorical.from_codes(codes, categories), index=db.index)
+        db[column] = values
+    return db
+
+
+def source_version(path):
+    """
+    Get the version of a source file as its modification time, size and inode.
+
+    Args:
+        path (str): Path to the source file.
+
+    Returns:
+        str: The version, which changes whenever the file is rewritten or replaced.
+    """
+    stat = os.stat(path)
+    return f"{stat.st_mtime_ns}-{stat.st_size}-{stat.st_ino}"
+
+
+def catalog_path(path):
+    """
+    Get the path of the compiled catalog kept next to a question bank CSV.
+
+    Args:
+        path (str): Path to the main question bank CSV.
+
+    Returns:
+        str: Path to the catalog file.
+    """
+    return path + CATALOG_SUFFIX
+
+
+def catalog_version(path=MAIN_DB_PATH, personal_path=PERSONAL_DB_PATH, lookup_path=LOOKUP_DICTS_PATH):
+    """
+    Get the version of every source compiled into a catalog.
+
+    Args:
+        path (str): Path to the main question bank CSV.
+        personal_path (str): Path to the personal questions CSV.
+        lookup_path (str): Path to lookup_dicts.py.
+
+    Returns:
+        str: The version, which changes whenever a question bank or lookup_dicts.py is rewritten.
+    """
+    personal_version = source_version(personal_path) if os.path.exists(personal_path) else "none"
+    return f"{source_version(path)}/{personal_version}/{source_version(lookup_path)}"
+
+
+def read_personal(path=PERSONAL_DB_PATH):
+    """
+    Read the personal questions CSV.
+
+    Args:
+        path (str): Path to the personal questions CSV.
+
+    Returns:
+        pd.DataFrame: The personal questions, empty if the file does not exist.
+    """
+    if not os.path.exists(path):
+        return pd.DataFrame({column: pd.Series(dtype=object) for column in PERSONAL_COLUMNS})
+    return pd.read_csv(path, dtype=str)
+
+
+def read_descriptions(path=LOOKUP_DICTS_PATH):
+    """
+    Collect the description texts of lookup_dicts.py into one table. The file is executed afresh
+    instead of using the imported module, so an edit is picked up without restarting the process.
+
+    Args:
+        path (str): Path to lookup_dicts.py.
+
+    Returns:
+        pd.DataFrame: One row per description, with the name of its dictionary, the described value and the text.
+    """
+    namespace = runpy.run_path(path)
+    rows = [
+        (kind, name, text)
+        for kind in DESCRIPTION_KINDS
+        for name, text in namespace[kind].items()
+    ]
+    return pd.DataFrame(rows, columns=["kind", "name", "text"], dtype=object)
+
+
+def row_hashes(db):
+    """
+    Hash the content of every row of a question bank.
+
+    Args:
+        db (pd.DataFrame): The question bank.
+
+    Returns:
+        pd.Series: One 64-bit hash per row, indexed like db.
+    """
+    return pd.util.hash_pandas_object(db, index=False)
+
+
+def assign_row_ids(db, previous=None):
+    """
+    Index a freshly read question bank by row id, keeping the ids of the rows that did not change.
+
+    Rows are matched on their content, so an edited row counts as removed and added again, and the
+    n-th copy of a repeated row keeps the id of the n-th copy in the previous bank. Other rows get
+    ids above every previous id.
+
+    Args:
+        db (pd.DataFrame): The question bank as read, in file order.
+        previous (CatalogTable): The question bank of the previous catalog, or None.
+
+    Returns:
+        pd.DataFrame: db indexed by row id.
+    """
+    if previous is None or not len(previous) or previous.columns != list(db.columns):
+        return db
+    old = previous.frame()
+
+    def keys(df):
+        hashes = row_hashes(df)
+        return pd.DataFrame({"hash": hashes.to_numpy(), "copy": hashes.groupby(hashes).cumcount().to_numpy()})
+
+    ids = keys(db).merge(keys(old).assign(id=old.index.to_numpy()), how="left", on=["hash", "copy"])["id"]
+    added = ids.isna().to_numpy()
+    next_id = int(old.index.max()) + 1
+    ids = ids.to_numpy(dtype=np.float64)
+    ids[added] = np.arange(next_id, next_id + added.sum())
+    return db.set_axis(pd.Index(ids.astype(np.int64)), axis=0)
+
+
+def compile_catalog(path=MAIN_DB_PATH, personal_path=PERSONAL_DB_PATH, catalog_file=None, previous=None, lookup_path=LOOKUP_DICTS_PATH):
+    """
+    Compile the question banks, their parsed answer options and the descriptions into a catalog file.
+
+    Args:
+        path (str): Path to the main question bank CSV.
+        personal_path (str): Path to the personal questions CSV.
+        catalog_file (str): Path to the catalog file, next to the main question bank by default.
+        previous (Catalog): The catalog being replaced, whose row ids are kept for unchanged rows.
+        lookup_path (str): Path to lookup_dicts.py.
+
+    Returns:
+        str: Path to the catalog file.
+    """
+    catalog_file = catalog_file or catalog_path(path)
+    version = catalog_version(path, personal_path, lookup_path)
+    previous_bank = previous.tables["bank"] if previous is not None else None
+    bank = assign_row_ids(read_bank(path), previous_bank)
+    write_catalog(catalog_file, version, {
+        "bank": bank,
+        "options": option_table(bank[OPTIONS_COLUMN]),
+        "personal": explode_personal(read_personal(personal_path)),
+        "descriptions": read_descriptions(lookup_path),
+    })
+    return catalog_file
+
+
+def load_catalog(path=MAIN_DB_PATH, personal_path=PERSONAL_DB_PATH, lookup_path=LOOKUP_DICTS_PATH):
+    """
+    Open the compiled catalog of the question banks, compiling it first if it is missing or stale.
+
+    The catalog is memory-mapped, so opening it is nearly free and every process opening the same file
+    shares one copy of it in memory.
+
+    Args:
+        path (str): Path to the main question bank CSV.
+        personal_path (str): Path to the personal questions CSV.
+        lookup_path (str): Path to lookup_dicts.py.
+
+    Returns:
+        Catalog: The open catalog, with the tables "bank", "options", "personal" and "descriptions".
+    """
+    version = catalog_version(path, personal_path, lookup_path)
+    catalog_file = catalog_path(path)
+    # A read-only checkout compiles into the temporary folder instead
+    name = hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()[:16]
+    temp_file = os.path.join(tempfile.gettempdir(), f"{name}{CATALOG_SUFFIX}")
+    previous = None
+    for candidate in (catalog_file, temp_file):
+        try:
+            catalog = Catalog(candidate)
+        except (OSError, ValueError, KeyError):
+            continue
+        if catalog.version == version:
+            return catalog
+        # Row ids are carried over from the most recently compiled catalog
+        if previous is None or os.path.getmtime(candidate) > os.path.getmtime(previous.path):
+            previous = catalog
+    try:
+        compile_catalog(path, personal_path, catalog_file, previous, lookup_path)
+    except OSError:
+        catalog_file = compile_catalog(path, personal_path, temp_file, previous, lookup_path)
+    return Catalog(catalog_file)
+
+
+def load_data(path=MAIN_DB_PATH, compiled=True):
+    """
+    Load data from a CSV file and strips white spaces from all columns.
+
+    Args:
+        path (str): Path to the main question bank CSV.
+        compiled (bool): Whether to read the data from the compiled catalog instead of parsing the CSV.
+
+    Returns:
+        pd.DataFrame: The loaded data.
+    """
+    if compiled:
+        return load_catalog(path).tables["bank"].frame()
+    return read_bank(path)
+
+
+def descriptions(catalog):
+    """
+    Get the description texts stored in a catalog.
+
+    Args:
+        catalog (Catalog): The open catalog.
+
+    Returns:
+        dict: Maps each lookup_dicts dictionary name, such as "domain_descriptions", to its descriptions.
+    """
+    table = catalog.tables["descriptions"].frame()
+    result = {kind: {} for kind in DESCRIPTION_KINDS}
+    for kind, name, text in table.itertuples(index=False):
+        result.setdefault(kind, {})[name] = text
+    return result
+
+
+def option_sets(catalog):
+    """
+    Get the option sets stored in a catalog.
+
+    Args:
+        catalog (Catalog): The open catalog.
+
+    Returns:
+        list: The options of every set, by option-set id (the code of Answer Options in the bank).
+    """
+    table = catalog.tables["options"]
+    sets = [[] for _ in catalog.tables["bank"].categories(OPTIONS_COLUMN)]
+    # The options are stored in set and position order
+    for set_id, option in zip(table.column("set").tolist(), table.column("option")):
+        sets[set_id].append(option)
+    return sets
+
+
+def in_bank_order(data, ids):
+    """
+    Sort row ids by the position of their rows in the question bank. Ids follow the bank order until
+    rows are added or edited by a reload, since those rows get new ids.
+
+    Args:
+        data (pd.DataFrame or CatalogTable): The question bank, loaded or memory-mapped.
+        ids (np.ndarray): The row ids.
+
+    Returns:
+        np.ndarray: The row ids in bank order.
+    """
+    positions = data.positions(ids) if isinstance(data, CatalogTable) else data.index.get_indexer(ids)
+    return ids[np.argsort(positions, kind="stable")]
+
+
+def select_rows(data, ids=None, columns=None):
+    """
+    Get rows of the question bank by row id.
+
+    Args:
+        data (pd.DataFrame or CatalogTable): The question bank, loaded or memory-mapped.
+        ids (array-like): The row ids, in output order, or None for all rows.
+        columns (list): The columns, or None for all columns.
+
+    Returns:
+        pd.DataFrame: The rows.
+    """
+    if isinstance(data, CatalogTable):
+        return data.frame(ids, columns)
+    rows = data if ids is None else data.loc[ids]
+    return rows if columns is None else rows[list(columns)]
+
+
+def generate_questions(data, timeline, stakeholders, metrics, domains, questiontype, index=None):
+    """
+    Generates questions by filtering data based on selected parameters.
+
+    Args:
+        data (pd.DataFrame or CatalogTable): The question bank, loaded or memory-mapped.
+        timeline (int): The selected timeline.
+        stakeholders (list): The selected stakeholders.
+        metrics (list): The selected metrics.
+        domains (list): The selected domains.
+        questiontype (list): The selected question types.
+        index (FacetIndex): Prebuilt facet index over data, built on the fly if not given.
+
+    Returns:
+        pd.DataFrame: The DataFrame containing generated questions.
+    """
+    if index is None:
+        index = FacetIndex.from_frame(select_rows(data, columns=FACET_COLUMNS))
+
+    # Filter the questions based on the selected parameters
+    filtered_questions_df = select_rows(data, in_bank_order(data, index.select(domains, stakeholders, metrics, questiontype)))
+
+    return questions_frame(filtered_questions_df, timeline)
+
+
+def build_questionnaire(data, timeline, stakeholders, metrics, domains, questiontype, budget, quotas=None, index=None, duplicate_index=None):
+    """
+    Picks at most budget of the questions generate_questions would return, covering the selected
+    stakeholders, metric areas and question types as evenly as possible.
+
+    Args:
+        data (pd.DataFrame or CatalogTable): The question bank, loaded or memory-mapped.
+        timeline (int): The selected timeline.
+        stakeholders (list): The selected stakeholders.
+        metrics (list): The selected metrics.
+        domains (list): The selected domains.
+        questiontype (list): The selected question types.
+        budget (int): The maximum number of questions.
+        quotas (dict): Maps "Stakeholder", "Metric Area" or "Question Type" to dicts of value -> maximum
+            number of questions with that value.
+        index (FacetIndex): Prebuilt facet index over data, built on the fly if not given.
+        duplicate_index (DuplicateIndex): If given, at most one question of each near-duplicate group is picked.
+
+    Returns:
+        pd.DataFrame: The DataFrame containing the picked questions, in bank order.
+    """
+    if index is None:
+        index = FacetIndex.from_frame(select_rows(data, columns=FACET_COLUMNS))
+    ids = in_bank_order(data, index.select(domains, stakeholders, metrics, questiontype))
+    distinct = duplicate_index.groups(ids) if duplicate_index is not None else None
+    picked = select_covering(select_rows(data, ids, COVERAGE_COLUMNS), budget, quotas, distinct)
+    return questions_frame(select_rows(data, ids[np.sort(picked)]), timeline)
+
+
+def search_questions(data, query, timeline, stakeholders, metrics, domains, questiontype, search_index, index=None, limit=50):
+    """
+    Searches the question text and answer options, restricted to the selected parameters.
+    Unlike generate_questions, a parameter with nothing selected does not restrict the search.
+
+    Args:
+        data (pd.DataFrame or CatalogTable): The question bank, loaded or memory-mapped.
+        query (str): The search text.
+        timeline (int): The selected timeline.
+        stakeholders (list): The selected stakeholders.
+        metrics (list): The selected metrics.
+        domains (list): The selected domains.
+        questiontype (list): The selected question types.
+        search_index (SearchIndex): The full-text index over data.
+        index (FacetIndex): Prebuilt facet index over data, built on the fly if not given.
+        limit (int): The maximum number of questions, or None for all matches.
+
+    Returns:
+        pd.DataFrame: The matching questions, best match first.
+    """
+    if index is None:
+        index = FacetIndex.from_frame(select_rows(data, columns=FACET_COLUMNS))
+    candidates = None
+    if domains or stakeholders or metrics or questiontype:
+        candidates = bits_to_ids(index.select_bits(domains, stakeholders, metrics, questiontype, skip_empty=True))
+    ids, _ = search_index.search(query, limit=limit, candidates=candidates)
+    return questions_frame(select_rows(data, ids), timeline)
+
+
+def questions_frame(filtered_questions_df, timeline):
+    """
+    Builds the generated questions table from the selected rows of the question bank.
+
+    Args:
+        filtered_questions_df (pd.DataFrame): The selected rows, in output order.
+        timeline (int): The selected timeline.
+
+    Returns:
+        pd.DataFrame: The DataFrame containing generated questions.
+    """
+    data_df = pd.DataFrame({
+        "row_number" : range(0, len(filtered_questions_df)),
+        "questions": filtered_questions_df['Question'],
+        "relevant?": [False] * len(filtered_questions_df),
+        "domain": filtered_questions_df['Domain'],
+        "timeline (in months)": [timeline] * len(filtered_questions_df),
+        "stakeholders": filtered_questions_df['Stakeholder'],
+        "metrics": filtered_questions_df['Metric Area'],
+        "options" : filtered_questions_df["Answer Options"]
+    })
+
+    return data_df
+
+
+def generate_personal_questions(path=PERSONAL_DB_PATH, catalog=None):
+    """
+    Load the personal questions, one row per question.
+
+    Args:
+        path (str): Path to the personal questions CSV, read when no catalog is given.
+        catalog (Catalog): The open catalog to read the personal questions from.
+
+    Returns:
+        pd.DataFrame: The personal questions.
+    """
+    if catalog is not None:
+        return catalog.tables["personal"].frame()
+    personal_questions_df = explode_personal(read_personal(path))
+
+    return personal_questions_df
@@ -0,0 +1,121 @@
+"""
+This module picks a fixed number of questions that cover the selected facets as evenly as possible.
+Coverage is measured over the stakeholders, metric areas and question types of the picked questions,
+and over their stakeholder × metric area and metric area × question type pairs. Each of these
+elements adds log(1 + n) for the n picked questions carrying it, so the first question on a topic
+counts most and further questions on it count less and less. The objective is monotone submodular,
+which makes the greedy choice near optimal, and lazy evaluation keeps it cheap: questions with the
+same facets have the same gain, so the greedy runs over facet combinations instead of rows.
+"""
+
+import heapq
+import math
+
+import numpy as np
+import pandas as pd
+
+COVERAGE_COLUMNS = ("Stakeholder", "Metric Area", "Question Type")
+
+
+def facet_elements(key):
+    """
+    List the coverage elements of one combination of facet values.
+
+    Args:
+        key (tuple): One code per facet column.
+
+    Returns:
+        list: The hashable elements: every value, every pair of neighbouring columns and the combination itself.
+    """
+    elements = [("value", i, code) for i, code in enumerate(key)]
+    elements += [("pair", i, key[i], key[i + 1]) for i in range(len(key) - 1)]
+    elements.append(("all",) + tuple(key))
+    return elements
+
+
+def select_covering(facets, budget, quotas=None, distinct=None):
+    """
+    Pick rows that maximize coverage of their facet values with lazy greedy selection.
+
+    Args:
+        facets (pd.DataFrame): The facet values of the candidate rows, one column per facet.
+        budget (int): The maximum number of rows to pick.
+        quotas (dict): Maps facet columns to dicts of value -> maximum number of picked rows with that value.
+        distinct (np.ndarray): Optional label per row, such as a near-duplicate group; at most one row
+            per label is picked.
+
+    Returns:
+        np.ndarray: Positions of the picked rows in facets, in the order they were picked.
+    """
+    if budget <= 0 or facets.empty:
+        return np.empty(0, dtype=np.int64)
+    columns = list(facets.columns)
+    factorized = [pd.factorize(facets[column]) for column in columns]
+
+    # Rows with the same facet values always have the same gain, so the greedy works on groups.
+    # The codes are combined into one integer per row, shifted so missing values (-1) stay distinct.
+    combined = np.zeros(len(facets), dtype=np.int64)
+    for codes, uniques in factorized:
+        combined = combined * (len(uniques) + 1) + codes + 1
+    group_of_row, combined_keys = pd.factorize(combined)
+    rows = np.argsort(group_of_row, kind="stable")
+    bounds = np.searchsorted(group_of_row[rows], np.arange(len(combined_keys) + 1))
+    keys = []
+    for key in np.asarray(combined_keys).tolist():
+        codes = []
+        for _, uniques in reversed(factorized):
+            key, code = divmod(key, len(uniques) + 1)
+            codes.append(code - 1)
+        keys.append(tuple(reversed(codes)))
+    element_ids = {}
+    group_elements = [
+        [element_ids.setdefault(element, len(element_ids)) for element in facet_elements(key)]
+        for key in keys
+    ]
+    counts = np.zeros(len(element_ids), dtype=np.int64)
+
+    # Quotas are kept per column by code, with no entry meaning no limit
+    limits = []
+    for i, column in enumerate(columns):
+        column_quotas = (quotas or {}).get(column, {})
+        uniques = list(factorized[i][1])
+        limits.append({uniques.index(value): limit for value, limit in column_quotas.items() if value in uniques})
+    used = [dict() for _ in columns]
+
+    def gain(group):
+        return sum(math.log1p(counts[e] + 1) - math.log1p(counts[e]) for e in group_elements[group])
+
+    def blocked(group):
+        return any(used[i].get(code, 0) >= limits[i].get(code, budget) for i, code in enumerate(keys[group]))
+
+    # Every gain starts at log(2) per element, later gains can only be lower
+    heap = [(-len(elements) * math.log(2), group) for group, elements in enumerate(group_elements)]
+    heapq.heapify(heap)
+    next_row = bounds[:-1].copy()
+    labels = set()
+    picked = []
+    while heap and len(picked) < budget:
+        _, group = heapq.heappop(heap)
+        if blocked(group):
+            continue
+        if distinct is not None:
+            while next_row[group] < bounds[group + 1] and distinct[rows[next_row[group]]] in labels:
+                next_row[group] += 1
+        if next_row[group] == bounds[group + 1]:
+            continue
+        current = gain(group)
+        if heap and current < -heap[0][0]:
+            # The bound was stale and another group may now be better
+            heapq.heappush(heap, (-current, group))
+            continue
+
+        row = rows[next_row[group]]
+        next_row[group] += 1
+        picked.append(row)
+        counts[group_elements[group]] += 1
+        for i, code in enumerate(keys[group]):
+            used[i][code] = used[i].get(code, 0) + 1
+        if distinct is not None:
+            labels.add(distinct[row])
+        heapq.heappush(heap, (-gain(group), group))
+    return np.asarray(picked, dtype=np.int64)
@@ -0,0 +1,153 @@
+"""
+This module provides a bounded cache for generated question sets.
+Results are keyed on a normalized selection plus the version of the question bank they were
+generated from, so looking up a result never hashes the bank itself.
+"""
+
+import threading
+from collections import OrderedDict
+
+
+def selection_key(version, timeline, stakeholders, metrics, domains, questiontype):
+    """
+    Builds an order-insensitive cache key for a selection.
+
+    Args:
+        version (str): Version of the question bank the result is generated from.
+        timeline (int): The selected timeline.
+        stakeholders (list): The selected stakeholders.
+        metrics (list): The selected metrics.
+        domains (list): The selected domains.
+        questiontype (list): The selected question types.
+
+    Returns:
+        tuple: The hashable key.
+    """
+    return (
+        version,
+        int(timeline),
+        tuple(sorted(set(stakeholders))),
+        tuple(sorted(set(metrics))),
+        tuple(sorted(set(domains))),
+        tuple(sorted(set(questiontype))),
+    )
+
+
+def frame_size(df):
+    """
+    Get the memory used by a DataFrame, including the strings it holds.
+
+    Args:
+        df (pd.DataFrame): The DataFrame.
+
+    Returns:
+        int: The size in bytes.
+    """
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+class SelectionCache:
+    """
+    Thread-safe LRU cache bounded by both entry count and total size.
+
+    One instance is meant to be shared by every session in the server process. Cached values are
+    handed out as-is, so callers must copy a result before modifying it.
+    """
+
+    def __init__(self, max_entries=256, max_bytes=256 * 1024 * 1024, sizeof=frame_size):
+        """
+        Args:
+            max_entries (int): Maximum number of cached results.
+            max_bytes (int): Maximum total size of the cached results in bytes.
+            sizeof (callable): Returns the size in bytes of a cached value.
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Get a cached value and mark it as most recently used.
+
+        Args:
+            key (tuple): The cache key.
+
+        Returns:
+            The cached value, or None on a miss.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        """
+        Store a value, evicting the least recently used entries to stay within bounds.
+        Values larger than max_bytes on their own are not stored.
+
+        Args:
+            key (tuple): The cache key.
+            value: The value to store.
+        """
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def get_or_compute(self, key, compute):
+        """
+        Get a cached value, computing and storing it on a miss.
+
+        Args:
+            key (tuple): The cache key.
+            compute (callable): Computes the value when it is not cached.
+
+        Returns:
+            The cached or computed value.
+        """
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        """Drop every cached value, keeping the counters."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """
+        Get the cache counters.
+
+        Returns:
+            dict: Hits, misses, evictions, current entry count and current size in bytes.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
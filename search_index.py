@@ -0,0 +1,248 @@
+"""
+This module builds an inverted index over the question text for ranked full-text search.
+Each question is indexed with its answer options, and queries are ranked with BM25. Postings are kept
+as numpy arrays per term, so a query only touches the postings of its own terms instead of scanning
+every question. Updates never modify arrays in place, so a copy made with ``copy()`` before updating
+stays consistent for readers of the old index.
+"""
+
+import math
+import re
+from collections import Counter
+
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset(
+    "a an and are as at be by did do does for from had has have how i in is it its of on or our "
+    "that the this to was were what when where which who why will with you your".split()
+)
+
+
+def tokenize(text):
+    """
+    Split text into lowercase search terms, dropping stopwords.
+
+    Args:
+        text (str): The text to split. Missing values give no terms.
+
+    Returns:
+        list: The terms in order of appearance.
+    """
+    if not isinstance(text, str):
+        return []
+    return [term for term in TOKEN_PATTERN.findall(text.lower()) if term not in STOPWORDS]
+
+
+def document_text(db, columns=("Question", "Answer Options")):
+    """
+    Get the searchable text of every row of a question bank.
+
+    Args:
+        db (pd.DataFrame): The question bank.
+        columns (tuple): The text columns to index.
+
+    Returns:
+        pd.Series: The text per row, indexed like db.
+    """
+    # Categorical columns are read as plain values, since "" is not one of their categories
+    text = db[columns[0]].astype(object).fillna("").astype(str)
+    for column in columns[1:]:
+        text = text + " " + db[column].astype(object).fillna("").astype(str)
+    return text
+
+
+class SearchIndex:
+    """
+    BM25 ranked inverted index keyed by row id (the index label of the question bank).
+    """
+
+    def __init__(self, k1=1.2, b=0.75):
+        """
+        Args:
+            k1 (float): BM25 term frequency saturation.
+            b (float): BM25 document length normalization.
+        """
+        self.k1 = k1
+        self.b = b
+        self.postings = {}
+        self.lengths = np.zeros(0, dtype=np.int32)
+        self.documents = 0
+        self.total_length = 0
+        self._scores = {}
+
+    @classmethod
+    def from_frame(cls, db, **kwargs):
+        """
+        Build the index over a question bank.
+
+        Args:
+            db (pd.DataFrame): The question bank, indexed by non-negative integer row ids.
+            **kwargs: BM25 parameters passed to the constructor.
+
+        Returns:
+            SearchIndex: The built index.
+        """
+        index = cls(**kwargs)
+        index.add(np.asarray(db.index, dtype=np.int64), document_text(db).tolist())
+        return index
+
+    def copy(self):
+        """
+        Get a copy that can be updated without affecting this index.
+
+        Returns:
+            SearchIndex: The copy, sharing the unchanged posting arrays.
+        """
+        clone = SearchIndex(self.k1, self.b)
+        clone.postings = dict(self.postings)
+        clone.lengths = self.lengths
+        clone.documents = self.documents
+        clone.total_length = self.total_length
+        clone._scores = dict(self._scores)
+        return clone
+
+    def add(self, ids, texts):
+        """
+        Index new documents. Ids that are already indexed must be removed first.
+
+        Args:
+            ids (array-like): The row ids.
+            texts (list): The text of each row.
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        if ids.size == 0:
+            return
+        terms = {}
+        term_codes, doc_ids, frequencies = [], [], []
+        lengths = np.zeros(len(ids), dtype=np.int32)
+        for position, (doc_id, text) in enumerate(zip(ids.tolist(), texts)):
+            tokens = tokenize(text)
+            lengths[position] = len(tokens)
+            for term, count in Counter(tokens).items():
+                term_codes.append(terms.setdefault(term, len(terms)))
+                doc_ids.append(doc_id)
+                frequencies.append(count)
+
+        # Group the (term, document) pairs by term with one sort
+        term_codes = np.asarray(term_codes, dtype=np.int64)
+        order = np.argsort(term_codes, kind="stable")
+        doc_ids = np.asarray(doc_ids, dtype=np.int64)[order]
+        frequencies = np.asarray(frequencies, dtype=np.float32)[order]
+        bounds = np.searchsorted(term_codes[order], np.arange(len(terms) + 1))
+        for term, code in terms.items():
+            new_ids = doc_ids[bounds[code]:bounds[code + 1]]
+            new_frequencies = frequencies[bounds[code]:bounds[code + 1]]
+            if term in self.postings:
+                old_ids, old_frequencies = self.postings[term]
+                new_ids = np.concatenate([old_ids, new_ids])
+                new_frequencies = np.concatenate([old_frequencies, new_frequencies])
+            self.postings[term] = (new_ids, new_frequencies)
+            self._scores.pop(term, None)
+
+        capacity = max(len(self.lengths), int(ids.max()) + 1)
+        all_lengths = np.zeros(capacity, dtype=np.int32)
+        all_lengths[:len(self.lengths)] = self.lengths
+        all_lengths[ids] = lengths
+        self.lengths = all_lengths
+        self.documents += len(ids)
+        self.total_length += int(lengths.sum())
+
+    def remove(self, ids, texts):
+        """
+        Remove documents from the index.
+
+        Args:
+            ids (array-like): The row ids.
+            texts (list): The text each row was indexed with, used to find its postings.
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        if ids.size == 0:
+            return
+        touched = set()
+        for text in texts:
+            touched.update(tokenize(text))
+        for term in touched:
+            if term not in self.postings:
+                continue
+            term_ids, frequencies = self.postings[term]
+            keep = ~np.isin(term_ids, ids)
+            if keep.all():
+                continue
+            self._scores.pop(term, None)
+            if keep.any():
+                self.postings[term] = (term_ids[keep], frequencies[keep])
+            else:
+                del self.postings[term]
+        lengths = self.lengths.copy()
+        self.documents -= len(ids)
+        self.total_length -= int(lengths[ids].sum())
+        lengths[ids] = 0
+        self.lengths = lengths
+
+    def search(self, query, limit=50, candidates=None):
+        """
+        Rank the documents matching any query term with BM25.
+
+        Args:
+            query (str): The search text.
+            limit (int): The maximum number of results, or None for all matches.
+            candidates (array-like): Row ids to restrict the search to, or None for all rows.
+
+        Returns:
+            tuple: The matching row ids and their scores, best first.
+        """
+        terms = [term for term in dict.fromkeys(tokenize(query)) if term in self.postings]
+        if not terms or not self.documents:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        allowed = None
+        if candidates is not None:
+            allowed = np.zeros(len(self.lengths), dtype=bool)
+            candidates = np.asarray(candidates, dtype=np.int64)
+            allowed[candidates[candidates < len(allowed)]] = True
+
+        average_length = self.total_length / self.documents
+        matched_ids, matched_scores = [], []
+        for term in terms:
+            term_ids, _ = self.postings[term]
+            scores = self._term_scores(term, average_length)
+            if allowed is not None:
+                keep = allowed[term_ids]
+                term_ids, scores = term_ids[keep], scores[keep]
+            matched_ids.append(term_ids)
+            matched_scores.append(scores)
+
+        # Accumulate into one dense score per row id, which is linear instead of sorting the postings
+        totals = np.bincount(np.concatenate(matched_ids), weights=np.concatenate(matched_scores), minlength=len(self.lengths))
+        if limit is not None and limit < len(totals):
+            ids = np.argpartition(-totals, limit - 1)[:limit]
+            ids = ids[totals[ids] > 0]
+        else:
+            ids = np.flatnonzero(totals)
+        scores = totals[ids].astype(np.float32)
+        # Best score first, ties in bank order
+        order = np.lexsort((ids, -scores))
+        return ids[order].astype(np.int64), scores[order]
+
+    def _term_scores(self, term, average_length):
+        """
+        Get the BM25 score of a term in each document of its postings.
+        Scores are cached per term until its postings or the average document length change.
+
+        Args:
+            term (str): The term.
+            average_length (float): The current average document length.
+
+        Returns:
+            np.ndarray: The scores, aligned with the term's postings.
+        """
+        cached = self._scores.get(term)
+        if cached is not None and cached[0] == average_length:
+            return cached[1]
+        term_ids, frequencies = self.postings[term]
+        idf = math.log(1 + (self.documents - len(term_ids) + 0.5) / (len(term_ids) + 0.5))
+        norm = self.k1 * (1 - self.b + self.b * self.lengths[term_ids] / average_length)
+        scores = (idf * frequencies * (self.k1 + 1) / (frequencies + norm)).astype(np.float32)
+        self._scores[term] = (average_length, scores)
+        return scores